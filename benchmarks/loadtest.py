@@ -0,0 +1,361 @@
+"""Runs a generated app under concurrent load against synthetic data, and reports the throughput and latency
+percentiles of every endpoint.
+
+The data conforms to the pathbuilder the app was generated from: every root type gets --instances entities
+with all of their fields (list-valued ones get --min-values to --max-values values), entity references point to
+entities of the target root type. It's served by an in-process SPARQL endpoint (rdflib behind a local HTTP
+server, or Oxigraph if pyoxigraph is installed), with an optional simulated network latency. Alternatively,
+the data can be dumped and loaded into a real triple store (--dump, --sparql).
+
+The app, the load generator and the SPARQL endpoint share one process (and GIL), so the numbers are only
+meaningful relative to each other, e.g. to compare generation modes or query optimizations:
+
+uv run wisskas -input pathbuilder.xml endpoints -o /tmp/sync/app -ee person ...
+uv run wisskas -input pathbuilder.xml endpoints -o /tmp/async/app --async -ee person ...
+uv run python benchmarks/loadtest.py pathbuilder.xml /tmp/sync/app.py --latency 0.05
+uv run python benchmarks/loadtest.py pathbuilder.xml /tmp/async/app.py --latency 0.05
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import pathlib
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+from rdflib import Graph, Literal, URIRef
+from rdflib.util import guess_format
+
+from wisskas.filter import endpoint_exclude_fields
+from wisskas.manifest import Manifest
+from wisskas.sparql import IRI, path_triples
+from wisskas.wisski import WISSKI_TYPES, FieldType, parse_paths
+
+try:
+    import pyoxigraph
+except ImportError:  # the data is queried with rdflib, which is much slower
+    pyoxigraph = None
+
+DATA = "https://example.org/wisskas/data/"
+
+
+def generate_data(root_types, instances=20, min_values=0, max_values=1, seed=0):
+    """Creates the given number of entities for every root type, list-valued fields get min_values to
+    max_values values. Returns the graph and the entity IRIs by root type class"""
+    rng = random.Random(seed)
+    graph = Graph()
+    nodes = itertools.count()
+    entities = {
+        rdf_class: [URIRef(f"{DATA}{root.id}/{i}") for i in range(instances)]
+        for rdf_class, root in root_types.items()
+    }
+
+    def term(value, bindings, clone):
+        if isinstance(value, IRI):
+            return URIRef(value.value)
+        if value.name not in bindings:
+            if value.name != clone.binding:
+                bindings[value.name] = URIRef(f"{DATA}node/{next(nodes)}")
+            elif clone.datatype_property and clone.type == WISSKI_TYPES[FieldType.URI]:
+                bindings[value.name] = URIRef(f"{DATA}{clone.id}/{next(nodes)}")
+            elif clone.datatype_property:
+                bindings[value.name] = Literal(f"{clone.id} {next(nodes)}")
+            elif clone.entity_reference:
+                target = entities[clone.entity_reference.rdf_class]
+                bindings[value.name] = rng.choice(target)
+            else:
+                bindings[value.name] = URIRef(f"{DATA}node/{next(nodes)}")
+        return bindings[value.name]
+
+    def add(clone, bindings):
+        # the triples are the ones the generated queries match, see wisskas.sparql
+        for triple in path_triples(clone):
+            subject = term(triple.subject, bindings, clone)
+            obj = term(triple.object, bindings, clone)
+            predicate = triple.predicate.value
+            if predicate.startswith("^"):
+                graph.add((obj, URIRef(predicate[1:]), subject))
+            else:
+                graph.add((subject, URIRef(predicate), obj))
+        for field in clone.fields.values():
+            count = (
+                rng.randint(min_values, max_values) if field.cardinality == -1 else 1
+            )
+            for _ in range(count):
+                # every value gets its own nodes for the part of the path below the parent
+                add(field, dict(bindings))
+
+    for rdf_class, root in root_types.items():
+        # references aren't expanded, they point to the entities of their root type instead
+        clone = endpoint_exclude_fields(root, [], root.class_name, max_depth=0)
+        for entity in entities[rdf_class]:
+            add(clone, {clone.binding: entity})
+    return graph, entities
+
+
+class SPARQLEndpoint(ThreadingHTTPServer):
+    """Answers SPARQL queries over a graph on a free local port, after the given latency (in seconds).
+
+    Queries are evaluated by Oxigraph if pyoxigraph is installed. Otherwise rdflib is used, which joins the
+    type patterns of the generated queries before their properties, so it's only usable for small endpoints."""
+
+    daemon_threads = True
+
+    def __init__(self, graph: Graph, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), SPARQLHandler)
+        self.graph = graph
+        self.store = None
+        if pyoxigraph is not None:
+            self.store = pyoxigraph.Store()
+            self.store.load(
+                graph.serialize(format="nt", encoding="utf-8"),
+                format=pyoxigraph.RdfFormat.N_TRIPLES,
+            )
+        self.latency = latency
+        # rdflib's query parser isn't thread-safe, and evaluation holds the GIL anyway
+        self.lock = threading.Lock()
+        self.queries = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/sparql"
+
+    def handle_error(self, request, client_address):
+        # the app gave up waiting for the response
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def evaluate(self, query: str) -> bytes:
+        """Returns the SPARQL JSON results of the query"""
+        with self.lock:
+            self.queries += 1
+            if self.store is None:
+                return self.graph.query(query).serialize(format="json")
+        return self.store.query(query).serialize(
+            format=pyoxigraph.QueryResultsFormat.JSON
+        )
+
+
+class SPARQLHandler(BaseHTTPRequestHandler):
+    # keep connections alive like a real triple store
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.answer(parse_qs(urlsplit(self.path).query).get("query", [""])[0])
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.answer(parse_qs(body.decode()).get("query", [""])[0])
+
+    def answer(self, query: str):
+        time.sleep(self.server.latency)
+        try:
+            content = self.server.evaluate(query)
+            status = 200
+        except Exception as e:
+            content, status = str(e).encode(), 400
+        self.send_response(status)
+        self.send_header("Content-Type", "application/sparql-results+json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def load_app(entrypoint: pathlib.Path):
+    # generated entry points import their models from their own directory
+    sys.path.insert(0, str(entrypoint.parent.resolve()))
+    spec = importlib.util.spec_from_file_location(entrypoint.stem, entrypoint)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[entrypoint.stem] = module
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def root_class(entrypoint: pathlib.Path, entry) -> str:
+    """The class of the entities an endpoint returns, read from its query"""
+    query = entrypoint.with_name(f"{entry.filename}.rq").read_text()
+    prefixes = dict(re.findall(r"PREFIX (\S*): <([^>]*)>", query))
+    match = re.search(rf"\?{re.escape(entry.binding)} a (\S+) \.", query)
+    if match is None:
+        raise ValueError(f"no class for ?{entry.binding} in {entry.filename}.rq")
+    value = match.group(1)
+    if value.startswith("<"):
+        return value[1:-1]
+    prefix, local = value.split(":", 1)
+    return prefixes[prefix] + local
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))]
+
+
+async def measure(client: httpx.AsyncClient, requests, concurrency: int) -> dict:
+    latencies = []
+    statuses = Counter()
+    pending = iter(requests)
+
+    async def worker():
+        for path, params in pending:
+            start = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(n for status, n in statuses.items() if status >= 400),
+        "throughput": len(latencies) / elapsed,
+        **{f"p{p}": percentile(latencies, p) * 1000 for p in (50, 90, 99)},
+        "max": latencies[-1] * 1000,
+    }
+
+
+async def run(app, endpoints, args) -> dict[str, dict]:
+    rng = random.Random(args.seed)
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(
+            transport=transport, base_url="http://loadtest", timeout=None
+        ) as client,
+    ):
+        for path, entities in endpoints.items():
+            if entities is None:
+                # a first request (which isn't measured) tells the number of pages
+                response = await client.get(path, params={"size": args.page_size})
+                if response.is_error:
+                    logging.error(f"{path}: {response.status_code} {response.text}")
+                pages = max(1, response.json()["pages"]) if response.is_success else 1
+                requests = [
+                    (path, {"page": rng.randint(1, pages), "size": args.page_size})
+                    for _ in range(args.requests)
+                ]
+            else:
+                await client.get(path, params={"unique_identifier": str(entities[0])})
+                requests = [
+                    (path, {"unique_identifier": str(rng.choice(entities))})
+                    for _ in range(args.requests)
+                ]
+            results[path] = await measure(client, requests, args.concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("pathbuilder", type=pathlib.Path)
+    parser.add_argument(
+        "entrypoint",
+        type=pathlib.Path,
+        nargs="?",
+        help="the generated app's entry point (.py)",
+    )
+    parser.add_argument(
+        "--instances", type=int, default=20, help="entities per root type"
+    )
+    parser.add_argument(
+        "--min-values",
+        type=int,
+        default=0,
+        help="values per list-valued field, 0 leaves out (optional) groups",
+    )
+    parser.add_argument(
+        "--max-values",
+        type=int,
+        default=1,
+        help="values per list-valued field, single-query endpoints return the cross product of them (see --split-queries)",
+    )
+    parser.add_argument("--requests", type=int, default=200, help="per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds added to every SPARQL response",
+    )
+    parser.add_argument("--endpoint", action="append", help="only load these endpoints")
+    parser.add_argument(
+        "--sparql",
+        help="send the queries to this SPARQL endpoint instead, which has to serve the --dump of the data",
+    )
+    parser.add_argument(
+        "--dump",
+        type=pathlib.Path,
+        help="write the data to this file (format by extension, e.g. .ttl or .nt) and exit",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=pathlib.Path, help="also write the results")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    root_types, _paths = parse_paths(args.pathbuilder)
+    start = time.perf_counter()
+    graph, entities = generate_data(
+        root_types, args.instances, args.min_values, args.max_values, args.seed
+    )
+    print(f"generated {len(graph)} triples in {time.perf_counter() - start:.1f}s")
+    if args.dump:
+        graph.serialize(
+            args.dump, format=guess_format(str(args.dump)) or "turtle", encoding="utf-8"
+        )
+        return
+    if args.entrypoint is None:
+        parser.error("the entrypoint is required unless the data is dumped")
+
+    manifest = Manifest.load(args.entrypoint.with_suffix(".manifest.json"))
+    # list endpoints are paged through, details endpoints are asked for random entities
+    endpoints = {
+        path: entities[root_class(args.entrypoint, entry)] if entry.details else None
+        for path, entry in manifest.endpoints.items()
+        if not args.endpoint or path in args.endpoint
+    }
+
+    server = None if args.sparql else SPARQLEndpoint(graph, args.latency)
+    if server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["WISSKAS_SPARQL_ENDPOINT"] = args.sparql or server.url
+    try:
+        results = asyncio.run(run(load_app(args.entrypoint), endpoints, args))
+    finally:
+        if server:
+            server.shutdown()
+
+    print(
+        f"{'endpoint':<40} {'requests':>8} {'errors':>6} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    for path, result in results.items():
+        print(
+            f"{path:<40} {result['requests']:>8} {result['errors']:>6} {result['throughput']:>8.1f} "
+            f"{result['p50']:>8.1f} {result['p90']:>8.1f} {result['p99']:>8.1f} {result['max']:>8.1f}"
+        )
+    if server:
+        print(f"{server.queries} SPARQL queries")
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Generates synthetic WissKI pathbuilder XML for benchmarking.
+
+Every root type has a tree of groups and fields below it. The shape of the tree is controlled by its depth and
+fan-out (the number of paths per group), the share of fields that are entity references to other root types,
+and whether those references can form cycles.
+
+uv run python benchmarks/pathbuilder.py --paths 5000 -o /tmp/pathbuilder.xml
+"""
+
+import argparse
+import random
+import sys
+import uuid
+from dataclasses import dataclass
+from xml.sax.saxutils import escape
+
+NAMESPACE = "https://example.org/wisskas/"
+
+
+@dataclass(frozen=True)
+class PathbuilderShape:
+    # number of root types, or the (approximate) total number of paths if paths is set
+    roots: int = 10
+    paths: int | None = None
+    # levels of nested groups below the root types
+    depth: int = 2
+    # paths per group
+    fanout: int = 4
+    # share of the paths in a group that are (nested) groups, as long as depth allows
+    groups: float = 0.3
+    # share of the fields that are entity references to root types
+    references: float = 0.2
+    # share of the paths that are list-valued
+    lists: float = 0.25
+    # whether entity references can point back to the root type they are in (or one that refers to it)
+    cycles: bool = True
+    seed: int = 0
+
+
+def path_element(
+    path_id,
+    group_id,
+    path_array,
+    weight,
+    is_group=False,
+    fieldtype=None,
+    datatype_property=None,
+    cardinality=1,
+    rng=None,
+) -> str:
+    x = "".join(f"\n\t\t\t<x>{escape(step)}</x>" for step in path_array)
+    return f"""
+	<path>
+		<id>{path_id}</id>
+		<weight>{weight}</weight>
+		<enabled>1</enabled>
+		<group_id>{group_id or 0}</group_id>
+		<bundle>{rng.getrandbits(128):032x}</bundle>
+		<field>{"" if is_group else f"{rng.getrandbits(128):032x}"}</field>
+		<fieldtype>{fieldtype or ""}</fieldtype>
+		<displaywidget />
+		<formatterwidget />
+		<cardinality>{cardinality}</cardinality>
+		<field_type_informative>{fieldtype or ""}</field_type_informative>
+		<path_array>{x}
+		</path_array>
+		<datatype_property>{escape(datatype_property or "empty")}</datatype_property>
+		<short_name />
+		<disamb>0</disamb>
+		<description />
+		<uuid>{uuid.UUID(int=rng.getrandbits(128))}</uuid>
+		<is_group>{int(is_group)}</is_group>
+		<name>{path_id.replace("_", " ")}</name>
+	</path>"""
+
+
+def generate_root(shape: PathbuilderShape, index: int, root_count, rng) -> list[str]:
+    """The paths of one root type and all of its groups and fields"""
+    root_id = f"root_{index}"
+    root_class = f"{NAMESPACE}Root{index}"
+    elements = [
+        path_element(root_id, None, [root_class], index, True, cardinality=-1, rng=rng)
+    ]
+
+    def reference_target():
+        candidates = range(root_count) if shape.cycles else range(index + 1, root_count)
+        return rng.choice(candidates) if len(candidates) else None
+
+    def add_group(group_id, path_array, level):
+        for i in range(shape.fanout):
+            path_id = f"{group_id}_{i}"
+            cardinality = -1 if rng.random() < shape.lists else 1
+            if level < shape.depth and rng.random() < shape.groups:
+                subgroup_array = [
+                    *path_array,
+                    f"{NAMESPACE}has_{path_id}",
+                    f"{NAMESPACE}{path_id.title().replace('_', '')}",
+                ]
+                elements.append(
+                    path_element(
+                        path_id,
+                        group_id,
+                        subgroup_array,
+                        i,
+                        True,
+                        None,
+                        None,
+                        cardinality,
+                        rng,
+                    )
+                )
+                add_group(path_id, subgroup_array, level + 1)
+            elif (
+                rng.random() < shape.references
+                and (target := reference_target()) is not None
+            ):
+                elements.append(
+                    path_element(
+                        path_id,
+                        group_id,
+                        [
+                            *path_array,
+                            f"{NAMESPACE}refers_{path_id}",
+                            f"{NAMESPACE}Root{target}",
+                        ],
+                        i,
+                        fieldtype="entity_reference",
+                        cardinality=cardinality,
+                        rng=rng,
+                    )
+                )
+            else:
+                elements.append(
+                    path_element(
+                        path_id,
+                        group_id,
+                        path_array,
+                        i,
+                        fieldtype="string",
+                        datatype_property=f"{NAMESPACE}value_{path_id}",
+                        cardinality=cardinality,
+                        rng=rng,
+                    )
+                )
+
+    add_group(root_id, [root_class], 1)
+    return elements
+
+
+def generate_pathbuilder(shape: PathbuilderShape) -> str:
+    rng = random.Random(shape.seed)
+    if shape.paths is None:
+        root_count = shape.roots
+    else:
+        # estimate the number of roots from the paths of a sample root
+        sample = generate_root(shape, 0, 1, random.Random(shape.seed))
+        root_count = max(1, round(shape.paths / len(sample)))
+    elements = []
+    for index in range(root_count):
+        elements.extend(generate_root(shape, index, root_count, rng))
+    return f"<pathbuilderinterface>{''.join(elements)}\n</pathbuilderinterface>\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    defaults = PathbuilderShape()
+    parser.add_argument("--roots", type=int, default=defaults.roots)
+    parser.add_argument(
+        "--paths", type=int, help="approximate number of paths (overrides --roots)"
+    )
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--groups", type=float, default=defaults.groups)
+    parser.add_argument("--references", type=float, default=defaults.references)
+    parser.add_argument("--lists", type=float, default=defaults.lists)
+    parser.add_argument(
+        "--no-cycles", dest="cycles", action="store_false", default=defaults.cycles
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+    output = args.__dict__.pop("output")
+    xml = generate_pathbuilder(PathbuilderShape(**vars(args)))
+    if output:
+        with open(output, "w") as f:
+            f.write(xml)
+    else:
+        sys.stdout.write(xml)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Measures the time and peak memory of every stage of wisskas (parsing, nesting, cloning and serialization) on
+the test pathbuilder and on synthetic pathbuilders of growing size, and compares them to stored baselines.
+
+uv run python benchmarks/stages.py [--scenario NAME ...] [--runs N] [--save] [--check]
+
+Baselines are machine-specific: record them with --save on the machine that runs --check.
+"""
+
+import argparse
+import gc
+import json
+import pathlib
+import sys
+import time
+import tracemalloc
+
+from pathbuilder import PathbuilderShape, generate_pathbuilder
+
+from wisskas.filter import endpoint_exclude_fields, endpoint_include_fields
+from wisskas.serialize import serialize_model, serialize_query
+from wisskas.wisski import nest_paths, parse_pathbuilder_paths
+
+BASELINES = pathlib.Path(__file__).with_name("baselines.json")
+# absolute differences that are always tolerated, so that noise in very fast stages isn't reported
+SLACK = {"seconds": 0.005, "peak_mb": 0.5}
+
+SCENARIOS = {
+    "releven": pathlib.Path(__file__).parent.parent
+    / "tests/data/releven_assertions_20240821.xml",
+    "small": PathbuilderShape(paths=200),
+    "medium": PathbuilderShape(paths=1000),
+    "large": PathbuilderShape(paths=3000),
+    "deep": PathbuilderShape(paths=1000, depth=4, fanout=2, groups=0.6),
+    "wide": PathbuilderShape(paths=1000, depth=1, fanout=30, references=0.1),
+    # every entity reference is expanded up to the default maximum depth, so the
+    # clones grow with the number of references per root type to that power
+    "references": PathbuilderShape(paths=1000, references=0.4),
+    "acyclic": PathbuilderShape(paths=1000, references=0.4, cycles=False),
+}
+
+
+def clone_roots(root_types, include):
+    """Clones the complete subtree of every root type, like the endpoints of a full API"""
+    memo = {}
+    endpoint_fields = endpoint_include_fields if include else endpoint_exclude_fields
+    return [
+        endpoint_fields(root, ["**"] if include else [], root.class_name, memo)
+        for root in root_types.values()
+    ]
+
+
+# every stage gets the results of the previous ones (by stage name)
+STAGES = {
+    "parse": lambda results: parse_pathbuilder_paths(results["xml"]),
+    "nest": lambda results: nest_paths(results["parse"]),
+    "clone_exclude": lambda results: clone_roots(results["nest"][0], include=False),
+    # the same trees, but through the other code path
+    "clone_include": lambda results: clone_roots(results["nest"][0], include=True),
+    "serialize_model": lambda results: [
+        serialize_model(root) for root in results["clone_exclude"]
+    ],
+    "serialize_query": lambda results: [
+        serialize_query(root) for root in results["clone_exclude"]
+    ],
+}
+
+
+def run_scenario(xml: bytes, runs: int) -> dict[str, dict[str, float]]:
+    """Returns the fastest time (in seconds) and the peak memory (in MB) of every stage"""
+    results = {"xml": xml}
+    measurements = {}
+    for name, stage in STAGES.items():
+        times = []
+        for _ in range(runs):
+            gc.collect()
+            start = time.perf_counter()
+            results[name] = stage(results)
+            times.append(time.perf_counter() - start)
+        # tracing slows everything down, so memory is measured in a separate run
+        gc.collect()
+        tracemalloc.start()
+        stage(results)
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        measurements[name] = {
+            "seconds": round(min(times), 5),
+            "peak_mb": round(peak / 2**20, 3),
+        }
+    return measurements
+
+
+def scenario_xml(scenario) -> bytes:
+    if isinstance(scenario, pathlib.Path):
+        return scenario.read_bytes()
+    return generate_pathbuilder(scenario).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scenario", action="append", choices=SCENARIOS, help="default: all"
+    )
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the new baselines"
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="exit with an error if any stage is slower (or uses more memory) than its baseline allows",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed relative regression (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    regressions = []
+    for scenario in args.scenario or SCENARIOS:
+        xml = scenario_xml(SCENARIOS[scenario])
+        results = run_scenario(xml, args.runs)
+        print(f"{scenario} ({xml.count(b'<path>')} paths)")
+        for stage, result in results.items():
+            line = f"  {stage:<16} {result['seconds'] * 1000:9.1f}ms {result['peak_mb']:8.1f}MB"
+            baseline = baselines.get(scenario, {}).get(stage)
+            if baseline:
+                for metric, slack in SLACK.items():
+                    ratio = result[metric] / baseline[metric] if baseline[metric] else 1
+                    line += f"  {metric} x{ratio:.2f}"
+                    if result[metric] > baseline[metric] * (1 + args.tolerance) + slack:
+                        regressions.append(f"{scenario} {stage} {metric} x{ratio:.2f}")
+            print(line)
+        if args.save:
+            baselines[scenario] = results
+
+    if args.save:
+        BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+    if args.check and regressions:
+        print("regressions:", *regressions, sep="\n  ")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Measures the wall clock time of (short) wisskas CLI invocations in fresh interpreter processes.
+
+uv run python benchmarks/startup.py [--runs N]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+INPUT = "tests/data/releven_assertions_20240821.xml"
+
+COMMANDS = {
+    "import": [],
+    "--help": ["--help"],
+    "paths --flat": ["--no-cache", "paths", "--flat"],
+    "paths --nested (cached)": ["paths", "--nested"],
+    "endpoints (cached)": ["endpoints", "-ee", "external_authority"],
+}
+
+
+def run(args, cache_dir) -> float:
+    code = (
+        "from wisskas.cli.main import main; main()"
+        if args
+        else "import wisskas.cli.main"
+    )
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code, "-input", INPUT, "--cache-dir", cache_dir, *args]
+        if args
+        else [sys.executable, "-c", code],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, command in COMMANDS.items():
+            # warm up the pathbuilder and template caches
+            run(command, cache_dir)
+            times = [run(command, cache_dir) for _ in range(args.runs)]
+            print(
+                f"{name:<28} min {min(times) * 1000:7.1f}ms  median {statistics.median(times) * 1000:7.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
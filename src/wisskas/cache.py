@@ -0,0 +1,79 @@
+import contextlib
+import functools
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+
+# bump whenever the layout of the cached objects changes
+CACHE_FORMAT = 6
+
+
+def default_cache_dir() -> pathlib.Path:
+    """Returns the per-user cache directory, respecting $XDG_CACHE_HOME"""
+    base = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(base) / "wisskas"
+
+
+@functools.cache
+def wisskas_version() -> str:
+    # importlib.metadata is slow to import, only do so when the version is needed
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("wisskas")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def cache_key(content: bytes) -> str:
+    """Creates a cache key from the (XML) content, the wisskas version and the cache format"""
+    digest = hashlib.sha256(f"{wisskas_version()}:{CACHE_FORMAT}:".encode())
+    digest.update(content)
+    return digest.hexdigest()
+
+
+def cache_file(cache_dir: pathlib.Path, key: str) -> pathlib.Path:
+    return cache_dir / f"{key}.pickle"
+
+
+def load(cache_dir: pathlib.Path, key: str):
+    """Loads a cached object, returns None if there is no (readable) cache entry for the key"""
+    filename = cache_file(cache_dir, key)
+    try:
+        with open(filename, "rb") as f:
+            value = pickle.load(f)
+    except FileNotFoundError:
+        logging.debug(f"cache miss for {key}")
+        return None
+    except Exception as e:
+        logging.warning(f"ignoring unreadable cache file {filename}: {e}")
+        return None
+    logging.info(f"loaded cached pathbuilder from {filename}")
+    return value
+
+
+def store(cache_dir: pathlib.Path, key: str, value):
+    """Atomically writes an object to the cache (the cache is only ever read by the user who wrote it)"""
+    filename = cache_file(cache_dir, key)
+    temporary = None
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            temporary = f.name
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, filename)
+        temporary = None
+    except (OSError, RecursionError, pickle.PicklingError) as e:
+        # not caching is always an option
+        logging.warning(f"could not write cache file {filename}: {e}")
+        return
+    finally:
+        if temporary is not None:
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+    logging.info(f"cached pathbuilder at {filename}")
@@ -1,13 +1,12 @@
+import pathlib
 from argparse import ArgumentParser
 from typing import Callable
-from rich import print as rprint
-from rich.rule import Rule
-from rich.syntax import Syntax
 
-from wisskas.filter import endpoint_exclude_fields, endpoint_include_fields
-from wisskas.serialize import serialize_entrypoint, serialize_model, serialize_query
-from wisskas.string_utils import parse_endpointspec, path_to_camelcase, path_to_filename
-from wisskas.wisski import parse_paths
+from wisskas.filter import DEFAULT_MAX_DEPTH
+
+
+def max_depth(value: str) -> int | None:
+    return None if value == "none" else int(value)
 
 
 def register_subcommand(parser: ArgumentParser) -> Callable:
@@ -41,6 +40,69 @@ def register_subcommand(parser: ArgumentParser) -> Callable:
         default=[],
     )
 
+    parser.add_argument(
+        "-s",
+        "--spec",
+        type=pathlib.Path,
+        action="append",
+        default=[],
+        help="a TOML file that declares endpoints (in addition to the ones given by -ee/-ei), with their path id, route, include or exclude fields, prefixes and generation options",
+    )
+
+    parser.add_argument(
+        "--max-depth",
+        type=max_depth,
+        default=DEFAULT_MAX_DEPTH,
+        help=f"maximum number of nested entity references that are expanded implicitly (by exclude-based endpoints or '**' includes), references beyond it become plain URI fields. References that would close a cycle always do, 'none' only limits those (default: {DEFAULT_MAX_DEPTH})",
+    )
+
+    parser.add_argument(
+        "--no-optimize",
+        dest="optimize",
+        action="store_false",
+        help="don't optimize the generated SPARQL queries (flattening of required groups, removal of redundant triple patterns and join reordering)",
+    )
+
+    parser.add_argument(
+        "--split-queries",
+        action="store_true",
+        help="query every list-valued field separately, restricted to the entities of the requested page (or the requested entity), instead of joining all of them in a single query (which returns the cross product of their values)",
+    )
+
+    parser.add_argument(
+        "--shared-models",
+        action="store_true",
+        help="write every distinct model class only once, into a module that the models of all endpoints import from (endpoints with identical (parts of their) models then share the same classes), all endpoints are always regenerated",
+    )
+
+    parser.add_argument(
+        "--field-projection",
+        action="store_true",
+        help="let clients of the generated endpoints request a subset of the fields with a 'fields' parameter (using the same syntax as --endpoint-include-fields, comma-separated), the query and model are pruned accordingly",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="keep the parsed paths in memory and keep running, whenever the input file changes only the endpoints whose paths changed are regenerated (stop with Ctrl-C)",
+    )
+
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=0.5,
+        help="seconds between checks of the input file for changes with --watch (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes that generate endpoints in parallel (default: %(default)s)",
+    )
+
     file_output = parser.add_argument_group(
         "File output options",
     )
@@ -50,11 +112,19 @@ def register_subcommand(parser: ArgumentParser) -> Callable:
         help="write generated models and queries to disk, using this output filename prefix",
     )
 
+    file_output.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="regenerate all endpoints, even the ones whose inputs are unchanged according to the manifest that is written next to the --output-prefix files",
+    )
+
     file_output.add_argument(
         "-a",
         "--server-address",
         metavar="sparql_api_url",
-        help="also generate FastAPI routes for all endpoints at the --output-prefix location, pointing to the given SPARQL endpoint URL",
+        nargs="+",
+        help="also generate FastAPI routes for all endpoints at the --output-prefix location, pointing to the given SPARQL endpoint URL (if several replicas are given, queries are spread over them)",
     )
 
     file_output.add_argument(
@@ -64,6 +134,93 @@ def register_subcommand(parser: ArgumentParser) -> Callable:
         help="allow CORS requests from these origins (default: %(default)s)",
     )
 
+    file_output.add_argument(
+        "--pool-size",
+        type=int,
+        help="maximum number of (keep-alive) connections from the FastAPI app to the SPARQL endpoint, can be overridden by $WISSKAS_POOL_SIZE (default: 10)",
+    )
+
+    file_output.add_argument(
+        "--connect-timeout",
+        type=float,
+        help="seconds to wait for a connection to the SPARQL endpoint, can be overridden by $WISSKAS_CONNECT_TIMEOUT (default: 5)",
+    )
+
+    file_output.add_argument(
+        "--timeout",
+        type=float,
+        help="seconds to wait for a response of the SPARQL endpoint, can be overridden by $WISSKAS_TIMEOUT (default: 60)",
+    )
+
+    file_output.add_argument(
+        "--failure-threshold",
+        type=int,
+        help="number of consecutive failed queries after which a SPARQL endpoint isn't used for --failure-cooldown seconds, can be overridden by $WISSKAS_FAILURE_THRESHOLD (default: 3)",
+    )
+
+    file_output.add_argument(
+        "--failure-cooldown",
+        type=float,
+        help="seconds that a failing SPARQL endpoint isn't used for, can be overridden by $WISSKAS_FAILURE_COOLDOWN (default: 30)",
+    )
+
+    file_output.add_argument(
+        "--cache",
+        action="store_true",
+        help="cache the responses of the FastAPI app in memory (with ETags), they can be dropped with a POST to /cache/invalidate if $WISSKAS_CACHE_TOKEN is set",
+    )
+
+    file_output.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="maximum number of cached responses, can be overridden by $WISSKAS_CACHE_SIZE (default: %(default)s)",
+    )
+
+    file_output.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=300,
+        help="seconds until a cached response expires (0 for never), can be overridden by $WISSKAS_CACHE_TTL (default: %(default)s)",
+    )
+
+    file_output.add_argument(
+        "--async",
+        dest="asynchronous",
+        action="store_true",
+        help="generate async route handlers, which query the SPARQL endpoint without blocking a thread",
+    )
+
+    file_output.add_argument(
+        "--max-concurrency",
+        type=int,
+        help="with --async, the maximum number of queries that are sent to the SPARQL endpoint at once, can be overridden by $WISSKAS_MAX_CONCURRENCY (default: --pool-size)",
+    )
+
+    file_output.add_argument(
+        "--endpoint-concurrency",
+        type=int,
+        help="with --async, the maximum number of requests per endpoint that query the SPARQL endpoint at once, can be overridden by $WISSKAS_ENDPOINT_CONCURRENCY (default: unlimited)",
+    )
+
+    file_output.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="with --async, let concurrent identical requests share one response",
+    )
+
+    file_output.add_argument(
+        "--metrics",
+        action="store_true",
+        help="instrument the FastAPI app: per-endpoint metrics are served at /metrics (in the Prometheus format), the time spent on each phase of a request is sent in a Server-Timing header",
+    )
+
+    file_output.add_argument(
+        "--lazy",
+        action="store_true",
+        help="let the FastAPI app import the models of an endpoint only when it is first requested (or by a warmup in the background, unless $WISSKAS_WARMUP is 0), so that it starts quickly and logs the duration of every startup phase. Its OpenAPI document is generated along with it (by importing the app once)",
+    )
+
     file_output.add_argument(
         "--git-endpoint",
         action="store_true",
@@ -74,9 +231,41 @@ def register_subcommand(parser: ArgumentParser) -> Callable:
 
 
 def main(args):
-    _root_types, paths = parse_paths(args.input)
+    # imported here so that other subcommands and --help don't pay for them
+    from wisskas.generate import (
+        EndpointSpec,
+        GenerationOptions,
+        generate_endpoints,
+        load_endpoint_specs,
+    )
+    from wisskas.manifest import Manifest
+    from wisskas.serialize import set_bytecode_cache_dir
+    from wisskas.string_utils import parse_endpointspec
+    from wisskas.wisski import parse_paths
+
+    if args.cache_dir:
+        set_bytecode_cache_dir(args.cache_dir / "templates")
+    _root_types, paths = parse_paths(args.input, args.cache_dir)
     args.prefix = dict(args.prefix)
-    endpoints = {}
+    options = GenerationOptions(
+        args.prefix,
+        args.output_prefix,
+        args.max_depth,
+        args.optimize,
+        args.split_queries,
+        args.field_projection,
+        args.shared_models,
+    )
+    specs = {}
+
+    def add_spec(spec):
+        if spec.path in specs:
+            raise RuntimeError(f"Endpoint path {spec.path} is specified more than once")
+        if spec.path_id not in paths:
+            raise RuntimeError(
+                f"Unknown path id {spec.path_id} for endpoint {spec.path}"
+            )
+        specs[spec.path] = spec
 
     for path_id, *filters in args.endpoint_include_fields:
         if len(filters) == 0:
@@ -84,61 +273,195 @@ def main(args):
                 f"endpoint '{path_id}' is defined using --endpoint-include-fields but is missing any fields to include"
             )
         path_id, endpoint_path = parse_endpointspec(path_id)
-
-        if endpoint_path in endpoints:
-            raise RuntimeError(
-                f"Endpoint path {endpoint_path} is specified more than once"
-            )
-        endpoints[endpoint_path] = endpoint_include_fields(
-            paths[path_id], filters, path_to_camelcase(endpoint_path)
-        )
+        add_spec(EndpointSpec(endpoint_path, path_id, tuple(filters), include=True))
 
     for path_id, *filters in args.endpoint_exclude_fields:
         path_id, endpoint_path = parse_endpointspec(path_id)
+        add_spec(EndpointSpec(endpoint_path, path_id, tuple(filters)))
 
-        if endpoint_path in endpoints:
-            raise RuntimeError(
-                f"Endpoint path {endpoint_path} is specified more than once"
-            )
-        endpoints[endpoint_path] = endpoint_exclude_fields(
-            paths[path_id],
-            filters,
-            path_to_camelcase(endpoint_path),
+    for spec_file in args.spec:
+        for spec in load_endpoint_specs(spec_file, options):
+            add_spec(spec)
+
+    # only files on disk can be regenerated incrementally
+    manifest = None
+    if args.output_prefix:
+        manifest_file = f"{args.output_prefix}.manifest.json"
+        manifest = (
+            Manifest(manifest_file) if args.force else Manifest.load(manifest_file)
+        )
+    endpoints = {
+        endpoint.path: endpoint
+        for endpoint in generate_endpoints(
+            paths, list(specs.values()), options, args.jobs, manifest
         )
+    }
+    write_endpoints(args, endpoints, endpoints.values(), manifest)
 
-    def print_code(code, language="python"):
-        rprint(Syntax(code, language, theme=args.color_theme), "\n")
+    if args.watch:
+        watch(args, paths, list(specs.values()), options, endpoints, manifest)
 
-    def dump_to_file(content, filename):
-        print(f"writing {filename}")
-        with open(filename, "w") as f:
-            f.write(content)
 
-    for path, root in endpoints.items():
-        filename = f"{args.output_prefix or ''}_{path_to_filename(path)}"
+def write_endpoints(args, endpoints, generated, manifest=None):
+    """Writes (or prints) the generated endpoints and the FastAPI entry point for all endpoints"""
+    from rich import print as rprint
+    from rich.rule import Rule
+    from rich.syntax import Syntax
+
+    from wisskas.generate import endpoint_filename, shared_models_filename
+    from wisskas.manifest import write_if_changed
+    from wisskas.serialize import (
+        openapi_document,
+        serialize_entrypoint,
+        serialize_shared_models,
+    )
+
+    def print_code(code, language="python"):
+        rprint(Syntax(code, language, theme=args.color_theme), "\n")
 
-        # this is the local filename
-        root.filename = filename.rsplit("/", 1)[-1]
-        root.details = path.endswith("details")
+    written = []
 
-        model = serialize_model(root)
-        query = serialize_query(root, args.prefix)
+    def dump_to_file(content, filename):
+        if write_if_changed(content, filename):
+            print(f"writing {filename}")
+            written.append(filename)
 
+    if args.shared_models:
+        # the shared classes (and the names of the ones of every endpoint) depend on all endpoints
+        filename = shared_models_filename(args.output_prefix)
+        shared_models = serialize_shared_models(
+            endpoints.values(), filename.rsplit("/", 1)[-1]
+        )
+        generated = endpoints.values()
         if args.output_prefix:
-            dump_to_file(model, f"{filename}.py")
-            dump_to_file(query, f"{filename}.rq")
+            dump_to_file(shared_models, f"{filename}.py")
+        else:
+            rprint(Rule("shared models"))
+            print_code(shared_models)
+
+    for endpoint in generated:
+        path = endpoint.path
+        if endpoint.model is None:
+            print(f"skipping unchanged endpoint {path}")
+        elif args.output_prefix:
+            filename = endpoint_filename(path, args.output_prefix)
+            dump_to_file(endpoint.model, f"{filename}.py")
+            dump_to_file(endpoint.query, f"{filename}.rq")
+            for branch in endpoint.branches:
+                dump_to_file(
+                    endpoint.branch_queries[branch.name],
+                    f"{filename}__{branch.name}.rq",
+                )
+            for name, representation in endpoint.representations.items():
+                stem = f"{filename}__{name}" if name else filename
+                dump_to_file(representation, f"{stem}.json")
 
         else:
             rprint(Rule(path))
-            print_code(model)
-            print_code(query, "sparql")
+            print_code(endpoint.model)
+            print_code(endpoint.query, "sparql")
+            for branch in endpoint.branches:
+                rprint(Rule(f"{path} {'/'.join(branch.path)}"))
+                print_code(endpoint.branch_queries[branch.name], "sparql")
+
+    def render_entrypoint(lazy=None):
+        return serialize_entrypoint(
+            endpoints,
+            args.server_address,
+            args.git_endpoint,
+            {"origins": args.cors},
+            {
+                "pool_size": args.pool_size,
+                "connect_timeout": args.connect_timeout,
+                "timeout": args.timeout,
+                "failure_threshold": args.failure_threshold,
+                "failure_cooldown": args.failure_cooldown,
+            },
+            {"size": args.cache_size, "ttl": args.cache_ttl} if args.cache else None,
+            {
+                "max": args.max_concurrency,
+                "endpoint": args.endpoint_concurrency,
+                "coalesce": args.coalesce,
+            }
+            if args.asynchronous
+            else None,
+            args.metrics,
+            lazy,
+        )
 
-    entrypoint = serialize_entrypoint(
-        endpoints, args.server_address, args.git_endpoint, {"origins": args.cors}
+    openapi_file = f"{args.output_prefix or 'app'}.openapi.json"
+    entrypoint = render_entrypoint(
+        {"openapi": pathlib.Path(openapi_file).name} if args.lazy else None
     )
 
     if args.output_prefix and args.server_address:
         dump_to_file(entrypoint, f"{args.output_prefix}.py")
+        # the document only changes along with the generated files
+        if args.lazy and (written or not pathlib.Path(openapi_file).exists()):
+            dump_to_file(
+                openapi_document(render_entrypoint(), f"{args.output_prefix}.py"),
+                openapi_file,
+            )
     else:
         rprint(Rule("FastAPI entry point"))
         print_code(entrypoint)
+
+    if manifest is not None:
+        manifest.save(endpoints.keys())
+
+
+def file_state(file) -> tuple[int, int] | None:
+    try:
+        stat = file.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def watch(args, paths, specs, options, endpoints, manifest=None):
+    """Polls the input file until interrupted. On every change, the new paths are compared to the ones in
+    memory and only the endpoints whose subtrees contain changed paths are regenerated."""
+    import logging
+    import time
+
+    from lxml import etree
+
+    from wisskas.generate import affected_specs, generate_endpoints
+    from wisskas.manifest import changed_paths
+    from wisskas.wisski import nest_paths, parse_pathbuilder_paths
+
+    state = file_state(args.input)
+    print(f"watching {args.input} for changes")
+    try:
+        while True:
+            time.sleep(args.watch_interval)
+            current = file_state(args.input)
+            if current is None or current == state:
+                continue
+            start = time.perf_counter()
+            try:
+                _root_types, new_paths = nest_paths(parse_pathbuilder_paths(args.input))
+            except etree.XMLSyntaxError as e:
+                # most likely still being written, try again at the next check
+                logging.info(f"can't parse {args.input} (yet): {e}")
+                continue
+            state = current
+
+            changed = changed_paths(paths, new_paths)
+            try:
+                specs_to_generate = affected_specs(specs, changed, paths, new_paths)
+                generated = generate_endpoints(
+                    new_paths, specs_to_generate, options, args.jobs, manifest
+                )
+            except Exception as e:
+                logging.error(f"not regenerating endpoints for {args.input}: {e}")
+                continue
+            paths = new_paths
+            endpoints.update((endpoint.path, endpoint) for endpoint in generated)
+            if generated:
+                write_endpoints(args, endpoints, generated, manifest)
+            print(
+                f"{len(changed)} paths changed, regenerated {len(generated)} of {len(endpoints)} endpoints in {(time.perf_counter() - start) * 1000:.0f}ms"
+            )
+    except KeyboardInterrupt:
+        pass
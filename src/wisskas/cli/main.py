@@ -5,6 +5,7 @@ from typing import Callable
 
 from rich_argparse import RichHelpFormatter
 
+from wisskas.cache import default_cache_dir
 from wisskas.cli.endpoints import register_subcommand as endpoints_args
 from wisskas.cli.paths import register_subcommand as paths_args
 
@@ -59,7 +60,24 @@ def main(args=None):
         help="Increase the verbosity of the logging output: default is WARNING, use -v for INFO, -vv for DEBUG",
     )
 
+    cache = parser.add_argument_group(
+        "Cache options",
+    )
+    cache.add_argument(
+        "--cache-dir",
+        type=pathlib.Path,
+        default=default_cache_dir(),
+        help="directory in which parsed pathbuilder definitions are cached (default: %(default)s)",
+    )
+    cache.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always parse the pathbuilder XML, don't read or write the cache",
+    )
+
     args = parser.parse_args(args)
+    if args.no_cache:
+        args.cache_dir = None
 
     logging.basicConfig(
         level=max(10, 30 - 10 * args.verbose), format="%(levelname)s: %(message)s"
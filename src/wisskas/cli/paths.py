@@ -1,12 +1,6 @@
 from argparse import ArgumentParser
 from typing import Callable
 
-from rich import print as rprint
-from rich.rule import Rule
-from rich.tree import Tree
-
-from wisskas.wisski import parse_pathbuilder_paths, parse_paths
-
 
 def register_subcommand(parser: ArgumentParser) -> Callable:
     parser.set_defaults(func=main)
@@ -28,18 +22,30 @@ def register_subcommand(parser: ArgumentParser) -> Callable:
 
 
 def main(args):
+    # imported here so that other subcommands and --help don't pay for them
+    from rich import print as rprint
+    from rich.rule import Rule
+    from rich.syntax import Syntax
+    from rich.tree import Tree
+
+    from wisskas.wisski import PathIndex, parse_pathbuilder_paths, parse_paths
+
     def file_rule(msg):
         return Rule(f"{args.input.name}: {msg}")
 
     if args.flat:
-        paths = parse_pathbuilder_paths(args.input)
+        # only hold on to the raw XML when it is going to be printed
+        paths = parse_pathbuilder_paths(args.input, keep_xml=args.all or args.path_id)
 
         if args.all:
             args.path_id = sorted([path.id for path in paths])
 
         if args.path_id:
+            index = PathIndex(paths)
             for path_id in args.path_id:
-                rprint(next(filter(lambda p: p.id == path_id, paths)).xml)
+                if path_id not in index:
+                    raise RuntimeError(f"Unknown path id {path_id}")
+                rprint(Syntax(index[path_id].xml, "xml", theme=args.color_theme))
         else:
             for path in paths:
                 rprint(f"- {path.id}")
@@ -47,7 +53,7 @@ def main(args):
         rprint(file_rule(f"{len(paths)} paths"))
 
     elif args.nested:
-        root_types, paths = parse_paths(args.input)
+        root_types, paths = parse_paths(args.input, args.cache_dir)
 
         if args.all:
             args.path_id = sorted(path.id for path in root_types.values())
@@ -85,6 +91,8 @@ def main(args):
                 return tree
 
             for path_id in args.path_id:
+                if path_id not in paths:
+                    raise RuntimeError(f"Unknown path id {path_id}")
                 if paths[path_id].rdf_class:
                     rprint(generate_rich_tree(paths[path_id]), "")
         else:
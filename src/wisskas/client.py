@@ -0,0 +1,355 @@
+"""A pooled HTTP client for the SPARQL backend of generated apps, shared by all of their adapters"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from rdfproxy import Page, QueryParameters, SPARQLModelAdapter, SPARQLWrapper
+
+# private parts of rdfproxy, which is why its exact version is pinned
+from rdfproxy.constructor import _PageQueryConstructor
+from rdfproxy.mapper import _ModelBindingsMapper
+
+from wisskas.metrics import count_rows, phase, record
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_FAILURE_COOLDOWN = 30.0
+
+
+class Backend:
+    """A replica of the SPARQL endpoint, with the bookkeeping for load balancing and its circuit breaker"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        # while the circuit is open, the backend only gets queries if no other one is available
+        self.open_until = 0.0
+
+    def __repr__(self):
+        return f"Backend({self.url!r})"
+
+
+class Backends:
+    """Spreads queries over replicated SPARQL endpoints, always picking the available one with the fewest
+    outstanding queries.
+
+    Backends are checked passively: after failure_threshold consecutive failed queries a backend's circuit
+    opens, and it isn't used for cooldown seconds. After that it is tried again (half-open), a single success
+    closes its circuit, a single failure opens it again."""
+
+    def __init__(
+        self,
+        urls: list[str],
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_FAILURE_COOLDOWN,
+    ):
+        if not urls:
+            raise ValueError("no SPARQL endpoint given")
+        self.backends = [Backend(url) for url in urls]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        # ties are broken round-robin, so that sequential queries are spread as well
+        self.turn = 0
+
+    def __len__(self):
+        return len(self.backends)
+
+    def acquire(self, exclude=()) -> Backend:
+        """Picks the backend for the next query, other than the ones that were already tried for it"""
+        with self.lock:
+            rotated = self.backends[self.turn :] + self.backends[: self.turn]
+            self.turn = (self.turn + 1) % len(self.backends)
+            candidates = [backend for backend in rotated if backend not in exclude]
+            if not candidates:
+                raise RuntimeError("all SPARQL endpoints failed")
+            now = time.monotonic()
+            closed = [backend for backend in candidates if backend.open_until <= now]
+            if closed:
+                backend = min(closed, key=lambda backend: backend.outstanding)
+            else:
+                # if all circuits are open, the one that reopens first is the best bet
+                backend = min(candidates, key=lambda backend: backend.open_until)
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend: Backend, failed: bool = False):
+        with self.lock:
+            backend.outstanding -= 1
+            if not failed:
+                backend.failures = 0
+                backend.open_until = 0.0
+                return
+            backend.failures += 1
+            if backend.failures >= self.failure_threshold:
+                if backend.open_until <= time.monotonic():
+                    logging.warning(
+                        f"SPARQL endpoint {backend.url} failed {backend.failures} times, not using it for {self.cooldown}s"
+                    )
+                backend.open_until = time.monotonic() + self.cooldown
+
+
+def failed(response: httpx.Response) -> bool:
+    """Whether another replica might answer the query (unlike for client errors, e.g. syntax errors)"""
+    return response.status_code >= 500 or response.status_code == 429
+
+
+class SPARQLClient:
+    """Sends the queries of all adapters created by it through one keep-alive connection pool.
+
+    The target can be a list of replicated SPARQL endpoints, queries are then spread over them (see
+    Backends) and retried on another replica if one fails.
+
+    Pages can also be queried from async code with aget_page(), which never runs more than max_concurrency
+    queries at once (default: the pool size). The time spent on the phases of a query is recorded for the
+    metrics of the current request (see wisskas.metrics)."""
+
+    def __init__(
+        self,
+        target: str | list[str],
+        pool_size: int = DEFAULT_POOL_SIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_concurrency: int | None = None,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        failure_cooldown: float = DEFAULT_FAILURE_COOLDOWN,
+        adapter_cache_size: int = 256,
+        transport: httpx.BaseTransport | None = None,
+        async_transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.backends = Backends(
+            [target] if isinstance(target, str) else list(target),
+            failure_threshold,
+            failure_cooldown,
+        )
+        # rdfproxy needs a target, but all queries are sent to the backends by this client
+        self.target = self.backends.backends[0].url
+        limits = httpx.Limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size
+        )
+        timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.http = httpx.Client(limits=limits, timeout=timeout, transport=transport)
+        # the async client is only created when it's first used (from within the event loop)
+        self.async_http_options = {
+            "limits": limits,
+            "timeout": timeout,
+            "transport": async_transport,
+        }
+        self.async_http = None
+        self.semaphore = asyncio.Semaphore(max_concurrency or pool_size)
+        # rdfproxy runs the count and the items query of a page concurrently
+        self.executor = ThreadPoolExecutor(pool_size)
+        self.sparqlwrapper = PooledSPARQLWrapper(self)
+        self.adapter = functools.lru_cache(adapter_cache_size)(self._adapter)
+
+    @staticmethod
+    def request(query: str) -> dict:
+        return {
+            "data": {"output": "json", "query": query},
+            "headers": {"Accept": "application/sparql-results+json"},
+        }
+
+    def send(self, url: str, query: str) -> httpx.Response:
+        with phase("sparql"):
+            response = self.http.send(
+                self.http.build_request("POST", url, **self.request(query)),
+                stream=True,
+            )
+        try:
+            with phase("transfer"):
+                response.read()
+        finally:
+            response.close()
+        return response
+
+    async def asend(self, url: str, query: str) -> httpx.Response:
+        with phase("sparql"):
+            response = await self.async_http.send(
+                self.async_http.build_request("POST", url, **self.request(query)),
+                stream=True,
+            )
+        try:
+            with phase("transfer"):
+                await response.aread()
+        finally:
+            await response.aclose()
+        return response
+
+    def query(self, query: str) -> dict:
+        """Runs a query, returns the decoded SPARQL JSON results"""
+        tried = []
+        while True:
+            backend = self.backends.acquire(tried)
+            try:
+                response = self.send(backend.url, query)
+            except httpx.TransportError:
+                self.backends.release(backend, failed=True)
+                if len(tried) + 1 == len(self.backends):
+                    raise
+                tried.append(backend)
+                continue
+            except BaseException:
+                self.backends.release(backend)
+                raise
+            self.backends.release(backend, failed(response))
+            if failed(response) and len(tried) + 1 < len(self.backends):
+                tried.append(backend)
+                continue
+            response.raise_for_status()
+            with phase("parse"):
+                return response.json()
+
+    async def aquery(self, query: str) -> dict:
+        """Runs a query without blocking the event loop, returns the decoded SPARQL JSON results"""
+        if self.async_http is None:
+            self.async_http = httpx.AsyncClient(**self.async_http_options)
+        tried = []
+        async with self.semaphore:
+            while True:
+                backend = self.backends.acquire(tried)
+                try:
+                    response = await self.asend(backend.url, query)
+                except httpx.TransportError:
+                    self.backends.release(backend, failed=True)
+                    if len(tried) + 1 == len(self.backends):
+                        raise
+                    tried.append(backend)
+                    continue
+                except BaseException:
+                    # e.g. the request was cancelled, which says nothing about the backend
+                    self.backends.release(backend)
+                    raise
+                self.backends.release(backend, failed(response))
+                if failed(response) and len(tried) + 1 < len(self.backends):
+                    tried.append(backend)
+                    continue
+                response.raise_for_status()
+                with phase("parse"):
+                    return response.json()
+
+    def get_page(
+        self, adapter: SPARQLModelAdapter, query_parameters: QueryParameters
+    ) -> Page:
+        """Like adapter.get_page(), but records the time spent on building the models separately"""
+        page = adapter.get_page(query_parameters)
+        queried = _queried.get()
+        if queried is not None:
+            record("models", time.perf_counter() - queried)
+        return page
+
+    async def aget_page(
+        self, adapter: SPARQLModelAdapter, query_parameters: QueryParameters
+    ) -> Page:
+        """The async equivalent of get_page(). The count and the items query are awaited concurrently on the
+        event loop, only building the models (which is CPU-bound) happens in a worker thread."""
+        constructor = self.constructor(adapter, query_parameters)
+        items_results, count_results = await asyncio.gather(
+            self.aquery(constructor.get_items_query()),
+            self.aquery(constructor.get_count_query()),
+        )
+        items = await asyncio.to_thread(self.build_items, adapter, items_results)
+        bindings = SPARQLWrapper._get_bindings_from_json_response(count_results)
+        total = int(next(bindings)["cnt"])
+        return Page(
+            items=items,
+            page=query_parameters.page,
+            size=query_parameters.size,
+            total=total,
+            pages=math.ceil(total / query_parameters.size),
+        )
+
+    def get_items(
+        self, adapter: SPARQLModelAdapter, query_parameters: QueryParameters
+    ) -> list:
+        """Like get_page(), but only returns the items, without sending the count query"""
+        constructor = self.constructor(adapter, query_parameters)
+        return self.build_items(adapter, self.query(constructor.get_items_query()))
+
+    async def aget_items(
+        self, adapter: SPARQLModelAdapter, query_parameters: QueryParameters
+    ) -> list:
+        """The async equivalent of get_items()"""
+        constructor = self.constructor(adapter, query_parameters)
+        results = await self.aquery(constructor.get_items_query())
+        return await asyncio.to_thread(self.build_items, adapter, results)
+
+    @staticmethod
+    def constructor(
+        adapter: SPARQLModelAdapter, query_parameters: QueryParameters
+    ) -> _PageQueryConstructor:
+        # rdfproxy has no public API for building the queries of a page without running them
+        return _PageQueryConstructor(
+            query=adapter._query,
+            query_parameters=query_parameters,
+            model=adapter._model,
+        )
+
+    @staticmethod
+    def build_items(adapter: SPARQLModelAdapter, results: dict) -> list:
+        """Builds the models from the decoded SPARQL JSON results of an items query"""
+        with phase("parse"):
+            rows = list(SPARQLWrapper._get_bindings_from_json_response(results))
+        count_rows(len(rows))
+        with phase("models"):
+            return _ModelBindingsMapper(adapter._model, iter(rows)).get_models()
+
+    def _adapter(self, query: str, model) -> SPARQLModelAdapter:
+        # checking the query and model makes creating adapters expensive, so they are cached
+        adapter = SPARQLModelAdapter(target=self.target, query=query, model=model)
+        adapter.sparqlwrapper = self.sparqlwrapper
+        return adapter
+
+    def close(self):
+        self.http.close()
+        self.executor.shutdown(wait=False)
+
+    async def aclose(self):
+        if self.async_http is not None:
+            await self.async_http.aclose()
+        self.close()
+
+
+class PooledSPARQLWrapper(SPARQLWrapper):
+    """Replaces the transport of rdfproxy's SPARQL wrapper (which opens a new connection for every request)
+    with the client's. The queries of a page are run concurrently in the executor."""
+
+    def __init__(self, client: SPARQLClient):
+        super().__init__(client.target)
+        self.client = client
+
+    def queries(self, *queries: str):
+        # the metrics of the request are recorded from the worker threads as well
+        results = [
+            future.result()
+            for future in [
+                self.client.executor.submit(
+                    contextvars.copy_context().run, self.client.query, query
+                )
+                for query in queries
+            ]
+        ]
+        with phase("parse"):
+            bindings = [
+                list(self._get_bindings_from_json_response(result))
+                for result in results
+            ]
+        # the first query is the one for the items, the others (if any) count them
+        count_rows(len(bindings[0]))
+        _queried.set(time.perf_counter())
+        return [iter(rows) for rows in bindings]
+
+
+# when the last queries of the current context were answered
+_queried: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "queried", default=None
+)
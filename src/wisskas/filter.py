@@ -1,12 +1,14 @@
 import copy
+import functools
 import logging
 
 from wisskas.string_utils import (
     FILTER_PATH_SEPARATOR,
     create_names,
+    normalize_filterspec,
     parse_filterspec,
 )
-from wisskas.wisski import WISSKI_TYPES
+from wisskas.wisski import WISSKI_TYPES, FieldType
 
 
 class DummyRootPath:
@@ -16,17 +18,95 @@ class DummyRootPath:
         self.fields = {root_classname: root}
 
 
-def endpoint_exclude_fields(root, exclude, root_classname=None):
-    return clone_exclude(DummyRootPath(root_classname, root), root_classname, exclude)
+# maximum number of entity references that are expanded implicitly along any branch (None for no limit, but
+# references that would close a cycle are never expanded)
+DEFAULT_MAX_DEPTH = 2
 
 
-def endpoint_include_fields(root, include, root_classname=None):
-    return clone_include(DummyRootPath(root_classname, root), root_classname, include)
+def endpoint_exclude_fields(
+    root,
+    exclude,
+    root_classname=None,
+    memo=None,
+    max_depth=DEFAULT_MAX_DEPTH,
+    index=None,
+):
+    check_filterspec(root, exclude, index)
+    return clone_exclude(
+        DummyRootPath(root_classname, root),
+        root_classname,
+        exclude,
+        memo=memo,
+        max_depth=max_depth,
+    )
+
+
+def endpoint_include_fields(
+    root,
+    include,
+    root_classname=None,
+    memo=None,
+    max_depth=DEFAULT_MAX_DEPTH,
+    index=None,
+):
+    check_filterspec(root, include, index)
+    return clone_include(
+        DummyRootPath(root_classname, root),
+        root_classname,
+        include,
+        memo=memo,
+        max_depth=max_depth,
+    )
+
+
+def check_filterspec(root, filterspec, index=None):
+    """Warns about every field path of an endpoint's filterspec that doesn't exist. The fields of the groups
+    are looked up in the PathIndex if one is given, which also tells where unknown field ids actually are."""
+    for spec in filterspec:
+        path = root
+        prefix = [root.id]
+        for key in spec.split(FILTER_PATH_SEPARATOR):
+            group = path.entity_reference or path
+            fields = index.fields(group.id) if index is not None else group.fields
+            if key == "*" or key == "**":
+                if key == "*" and len(fields) == 0:
+                    logging.warning(
+                        f"found '{key}' at {FILTER_PATH_SEPARATOR.join(prefix)} even though there are no fields"
+                    )
+                break
+            # fields are keyed by their path id
+            if key not in fields:
+                location = ""
+                if index is not None and key in index:
+                    ancestors = [ancestor.id for ancestor in index.ancestors[key]]
+                    location = (
+                        f" (it is a field of {FILTER_PATH_SEPARATOR.join(ancestors)})"
+                    )
+                logging.warning(
+                    f"unknown field specified in include/exclude list at {FILTER_PATH_SEPARATOR.join(prefix)}: {key}{location}"
+                )
+                break
+            prefix.append(key)
+            path = fields[key]
+
 
+def find_cycle(references) -> int:
+    """Returns the length of the cycle that the last entity reference of the chain closes, i.e. the distance to
+    the previous occurrence of its target in the chain, or 0 if it doesn't close one"""
+    *previous, target = references
+    for n, path_id in enumerate(reversed(previous), 1):
+        if path_id == target:
+            return n
+    return 0
 
-def handle_recursion(prefix):
-    # TODO try to find recursion pattern === identical adjacent sequences of path ids
-    raise RuntimeError("recursion somewhere")
+
+def expansion_cutoff(references, max_depth) -> str | None:
+    """Returns why the last entity reference of the chain shouldn't be expanded (any further), or None"""
+    if max_depth is not None and len(references) - 1 > max_depth:
+        return f"maximum expansion depth {max_depth} reached"
+    if n := find_cycle(references):
+        return f"cycle {' > '.join(references[-n - 1 :])}"
+    return None
 
 
 def debug(task, path, msg, depth):
@@ -41,6 +121,66 @@ def debug_filter(path, msg, depth=0):
     debug("filtering", path, msg, depth)
 
 
+def memoized(clone_function):
+    """Shares clones of identical subtrees between all clone_* calls that are passed the same memo dict.
+
+    A clone only depends on the path being cloned, the (normalized) filterspec, the parent's path prefix and
+    class name, the binding variables it inherits and the entity reference chain leading up to it, so that's
+    what the memo is keyed on. Clones must not be modified once they're returned, since they might be reused
+    across several parents and endpoints.
+    """
+
+    @functools.wraps(clone_function)
+    def wrapper(parent, fieldname, filterspec, *args, memo=None, **kwargs):
+        if memo is None:
+            return clone_function(parent, fieldname, filterspec, *args, **kwargs)
+        key = (
+            clone_function.__name__,
+            parent.fields[fieldname],
+            normalize_filterspec(filterspec),
+            tuple(parent.path_array),
+            getattr(parent, "class_name", None),
+            tuple(parent.binding_vars) or fieldname,
+            kwargs.get("references", ()),
+            kwargs.get("max_depth", DEFAULT_MAX_DEPTH),
+        )
+        try:
+            return memo[key]
+        except KeyError:
+            clone = clone_function(
+                parent, fieldname, filterspec, *args, memo=memo, **kwargs
+            )
+            memo[key] = clone
+            return clone
+
+    return wrapper
+
+
+def collapse_to_uri(clone):
+    """Turns a (group) clone into a plain AnyUrl field bound to the clone's binding variable"""
+    clone.type = WISSKI_TYPES[FieldType.URI]
+    clone.fields = {}
+    if not clone.root:
+        clone.class_name = None
+
+
+def truncate(clone, cutoff):
+    """Collapses an entity reference that isn't expanded to the URI of the referenced entity"""
+    logging.info(
+        f"not expanding entity reference {clone.id} to {clone.entity_reference.id} ({cutoff}), only its URI is included"
+    )
+    collapse_to_uri(clone)
+
+
+def follow_reference(parent, fieldname, references):
+    """Returns the entity reference chain for the given field of the parent"""
+    path = parent.fields[fieldname]
+    if path.entity_reference:
+        return (*references, path.entity_reference.id)
+    # the endpoint root starts the chain
+    return references or (path.id,)
+
+
 def create_clone(parent, fieldname, filterspec, prefix, used_names, depth=0):
     # shallow copy
     clone = copy.copy(parent.fields[fieldname])
@@ -58,9 +198,9 @@ def create_clone(parent, fieldname, filterspec, prefix, used_names, depth=0):
 
     if clone.entity_reference:
         debug_clone(clone, f"entity reference to '{clone.entity_reference.id}'", depth)
-        clone.fields = clone.reference.fields
+        clone.fields = clone.entity_reference.fields
         clone.class_name = f"{parent.class_name}_{clone.entity_reference.class_name}"
-        clone.name = clone.reference.name
+        clone.name = clone.entity_reference.name
     # set parent paths to None
     if len(clone.path_array) > len(parent.path_array):
         for i in range(len(parent.path_array)):
@@ -100,72 +240,111 @@ def create_clone(parent, fieldname, filterspec, prefix, used_names, depth=0):
     debug_clone(clone, f"binding vars {clone.binding_vars}", depth)
 
     filters = parse_filterspec(filterspec)
-    for key in filters:
-        if key == "*" or key == "**":
-            if key == "*" and len(clone["fields"]) == 0:
-                logging.warning(
-                    f"found '{key}' at {'.'.join(prefix[1:])} even though there are no fields"
-                )
-            else:
-                debug_clone(clone, f"found field '{key}'", depth)
-            continue
-        exists = False
-        for f in clone["fields"].values():
-            if f["id"] == key:
-                debug_clone(clone, f"found field '{key}'", depth)
-                exists = True
-                break
-        if not exists:
-            logging.warning(
-                f"cloning {clone.id} unknown field specified in include/exclude list at {FILTER_PATH_SEPARATOR.join(prefix[1:])}: {key}"
-            )
+    debug_clone(clone, f"fields {list(filters)}", depth)
     return (clone, filters)
 
 
-def clone_exclude(parent, fieldname, exclude, prefix=[], used_names=set(), depth=0):
+@memoized
+def clone_exclude(
+    parent,
+    fieldname,
+    exclude,
+    prefix=[],
+    used_names=set(),
+    depth=0,
+    *,
+    memo=None,
+    references=(),
+    max_depth=DEFAULT_MAX_DEPTH,
+):
+    references = follow_reference(parent, fieldname, references)
     clone, excludes = create_clone(
         parent, fieldname, exclude, prefix, used_names, depth
     )
     debug_filter(clone, f"exclude {excludes}")
     if "*" in exclude:
-        clone.type = WISSKI_TYPES["uri"]
-        clone.fields = {}
+        collapse_to_uri(clone)
         # clone.datatype_property = None
         return clone
-    try:
-        clone.fields = {
-            name: clone_exclude(
-                clone, name, excludes.get(f.id, []), prefix, used_names, depth + 1
-            )
-            for name, f in clone.fields.items()
-            if excludes.get(f.id, None) != []
-        }
-    except RecursionError:
-        handle_recursion(prefix)
+    if clone.entity_reference and (cutoff := expansion_cutoff(references, max_depth)):
+        truncate(clone, cutoff)
+        return clone
+    clone.fields = {
+        name: clone_exclude(
+            clone,
+            name,
+            excludes.get(f.id, []),
+            prefix,
+            used_names,
+            depth + 1,
+            memo=memo,
+            references=references,
+            max_depth=max_depth,
+        )
+        for name, f in clone.fields.items()
+        if excludes.get(f.id, None) != []
+    }
     return clone
 
 
-def clone_include(parent, fieldname, include, prefix=[], used_names=set(), depth=0):
+@memoized
+def clone_include(
+    parent,
+    fieldname,
+    include,
+    prefix=[],
+    used_names=set(),
+    depth=0,
+    *,
+    memo=None,
+    references=(),
+    max_depth=DEFAULT_MAX_DEPTH,
+):
+    references = follow_reference(parent, fieldname, references)
     clone, includes = create_clone(
         parent, fieldname, include, prefix, used_names, depth
     )
     debug_filter(clone, f"include {includes}", depth)
     if "**" in include:
+        # only implicit expansion is bounded, explicitly included fields are always expanded
+        if clone.entity_reference and (
+            cutoff := expansion_cutoff(references, max_depth)
+        ):
+            truncate(clone, cutoff)
+            return clone
         clone.fields = {
-            name: clone_include(clone, name, ["**"], prefix, used_names)
+            name: clone_include(
+                clone,
+                name,
+                ["**"],
+                prefix,
+                used_names,
+                depth + 1,
+                memo=memo,
+                references=references,
+                max_depth=max_depth,
+            )
             for name in clone.fields.keys()
         }
     else:
-        clone["fields"] = {
+        clone.fields = {
             name: clone_include(
-                clone, name, includes.get(name, []), prefix, used_names, depth + 1
+                clone,
+                name,
+                includes.get(name, []),
+                prefix,
+                used_names,
+                depth + 1,
+                memo=memo,
+                references=references,
+                max_depth=max_depth,
             )
-            for name in clone["fields"].keys()
+            for name in clone.fields.keys()
             if "*" in include or name in includes
         }
-    if len(clone["fields"]) == 0 and not clone["datatype_property"]:
+    if len(clone.fields) == 0 and not clone.datatype_property:
         debug_filter(clone, "class is down to 0 fields", depth)
-        clone["type"] = WISSKI_TYPES["uri"]
+        collapse_to_uri(clone)
     else:
-        debug_filter(clone, f"remaining fields {list(clone['fields'].keys())}", depth)
+        debug_filter(clone, f"remaining fields {list(clone.fields.keys())}", depth)
     return clone
@@ -0,0 +1,387 @@
+import logging
+import multiprocessing
+import pathlib
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+
+from wisskas.filter import (
+    DEFAULT_MAX_DEPTH,
+    endpoint_exclude_fields,
+    endpoint_include_fields,
+)
+from wisskas.manifest import Manifest, endpoint_input_hash
+from wisskas.serialize import (
+    ModelClass,
+    model_table,
+    serialize_model,
+    serialize_query,
+    serialize_query_representation,
+    template_version,
+)
+from wisskas.split import Branch, split_model
+from wisskas.string_utils import id_to_classname, path_to_camelcase, path_to_filename
+from wisskas.wisski import PathIndex, nest_paths, path_records, paths_from_records
+
+
+@dataclass(frozen=True)
+class EndpointSpec:
+    """An endpoint to generate: the endpoint path, the root path id and the fields to include (or exclude)"""
+
+    path: str
+    path_id: str
+    filters: tuple[str, ...]
+    include: bool = False
+    # generation options of this endpoint, if they differ from the ones all endpoints are generated with
+    options: "GenerationOptions | None" = None
+
+
+@dataclass
+class GeneratedEndpoint:
+    """The serialized model and query of an endpoint, plus what the FastAPI entry point needs to know about it"""
+
+    path: str
+    filename: str
+    class_name: str
+    binding: str
+    details: bool
+    # None if the endpoint is unchanged and wasn't regenerated
+    model: str | None
+    query: str | None
+    # list-valued fields that are queried separately (with --split-queries), and their queries
+    branches: tuple[Branch, ...] = ()
+    branch_queries: dict[str, str] = field(default_factory=dict)
+    # whether the endpoint supports request-time projection (with --field-projection), and the query
+    # representations that it needs by branch name ("" for the main query)
+    projection: bool = False
+    representations: dict[str, str] = field(default_factory=dict)
+    # with shared models: the classes of the root and partial models, and the indexes of the ones that the
+    # endpoint module re-exports from the shared module with the names under which it does so (see
+    # serialize_shared_models)
+    models: tuple[ModelClass, ...] = field(default=(), compare=False, repr=False)
+    exports: tuple[tuple[int, str], ...] = field(default=(), compare=False, repr=False)
+
+    @property
+    def base_class_name(self) -> str:
+        """The model that the main query of a split endpoint is mapped to"""
+        return f"{self.class_name}__base"
+
+
+@dataclass(frozen=True)
+class GenerationOptions:
+    prefixes: dict[str, str]
+    output_prefix: str | None = None
+    max_depth: int | None = DEFAULT_MAX_DEPTH
+    optimize: bool = True
+    split_queries: bool = False
+    field_projection: bool = False
+    shared_models: bool = False
+
+
+# the generation options that can be set in endpoint spec files, and their types
+SPEC_OPTIONS = {
+    "max_depth": int,
+    "optimize": bool,
+    "split_queries": bool,
+    "field_projection": bool,
+}
+
+
+def spec_options(options: GenerationOptions, table: dict, where) -> GenerationOptions:
+    """Applies the generation options and prefixes of a table of a spec file to the options"""
+    for key, value in table.items():
+        if key in SPEC_OPTIONS and not isinstance(value, SPEC_OPTIONS[key]):
+            raise ValueError(
+                f"{where}: {key} should be of type {SPEC_OPTIONS[key].__name__}"
+            )
+    return replace(
+        options,
+        prefixes={**options.prefixes, **table.get("prefixes", {})},
+        **{key: table[key] for key in SPEC_OPTIONS if key in table},
+    )
+
+
+def load_endpoint_specs(
+    filename: pathlib.Path | str, options: GenerationOptions
+) -> list[EndpointSpec]:
+    """Reads the endpoints declared in a TOML spec file:
+
+    # generation options and prefixes for all endpoints (on top of the given options)
+    max_depth = 1
+    [prefixes]
+    crm = "http://www.cidoc-crm.org/cidoc-crm/"
+
+    [[endpoints]]
+    path_id = "person"
+    route = "/person/details"  # default: /<path_id>
+    exclude = ["person_appellation_assertion"]  # or include = [...]
+    split_queries = true  # generation options and prefixes of this endpoint
+    """
+    with open(filename, "rb") as f:
+        spec_file = tomllib.load(f)
+    unknown = spec_file.keys() - {"endpoints", "prefixes", *SPEC_OPTIONS}
+    if unknown:
+        raise ValueError(f"{filename}: unknown settings {sorted(unknown)}")
+    defaults = spec_options(options, spec_file, filename)
+
+    specs = []
+    for i, endpoint in enumerate(spec_file.get("endpoints", []), 1):
+        where = f"{filename}: endpoint {i}"
+        unknown = endpoint.keys() - {
+            "path_id",
+            "route",
+            "include",
+            "exclude",
+            "prefixes",
+            *SPEC_OPTIONS,
+        }
+        if unknown:
+            raise ValueError(f"{where}: unknown settings {sorted(unknown)}")
+        if "path_id" not in endpoint:
+            raise ValueError(f"{where}: missing path_id")
+        if "include" in endpoint and "exclude" in endpoint:
+            raise ValueError(f"{where}: specify either include or exclude, not both")
+        include = "include" in endpoint
+        filters = endpoint.get("include" if include else "exclude", [])
+        if include and len(filters) == 0:
+            raise ValueError(f"{where}: missing any fields to include")
+        endpoint_options = spec_options(defaults, endpoint, where)
+        specs.append(
+            EndpointSpec(
+                "/" + endpoint.get("route", endpoint["path_id"]).lstrip("/"),
+                endpoint["path_id"],
+                tuple(filters),
+                include,
+                endpoint_options if endpoint_options != options else None,
+            )
+        )
+    return specs
+
+
+def endpoint_filename(endpoint_path, output_prefix=None) -> str:
+    return f"{output_prefix or ''}_{path_to_filename(endpoint_path)}"
+
+
+def shared_models_filename(output_prefix=None) -> str:
+    return f"{output_prefix or ''}__models"
+
+
+def output_files(filename, branches=(), projection=False) -> list[str]:
+    """The files written for an endpoint: the model, the (main) query and the queries of all branches, plus
+    their query representations if the endpoint supports projection"""
+    stems = [filename, *(f"{filename}__{branch.name}" for branch in branches)]
+    return [
+        f"{filename}.py",
+        *(f"{stem}.rq" for stem in stems),
+        *(f"{stem}.json" for stem in stems if projection),
+    ]
+
+
+def affected_specs(specs: list[EndpointSpec], changed: set[str], *indexes):
+    """The specs whose endpoint subtrees (including all root types they refer to) contain any of the changed
+    path ids in any of the given PathIndexes, e.g. the ones before and after a change"""
+    # the changed paths as the groups and the root type that they are in
+    locations = [
+        (
+            index,
+            [
+                (
+                    {path_id, *(group.id for group in index.ancestors[path_id])},
+                    index.root_of(path_id).id,
+                )
+                for path_id in changed
+                if path_id in index
+            ],
+        )
+        for index in indexes
+    ]
+    return [
+        spec
+        for spec in specs
+        if any(
+            spec.path_id not in index
+            or any(
+                spec.path_id in groups or root_id in index.closure(spec.path_id)
+                for groups, root_id in changed_locations
+            )
+            for index, changed_locations in locations
+        )
+    ]
+
+
+def generate_endpoint(
+    paths, spec: EndpointSpec, options: GenerationOptions, memo=None
+) -> GeneratedEndpoint:
+    """Clones the endpoint's (filtered) subtree and serializes its model and query"""
+    options = spec.options or options
+    endpoint_fields = (
+        endpoint_include_fields if spec.include else endpoint_exclude_fields
+    )
+    root = endpoint_fields(
+        paths[spec.path_id],
+        list(spec.filters),
+        # shared models are bound to variables named after the path, so that endpoints of the same path share them
+        id_to_classname(spec.path_id)
+        if options.shared_models
+        else path_to_camelcase(spec.path),
+        memo,
+        options.max_depth,
+        paths,
+    )
+
+    # the root clone can be shared with other endpoints (see filter.memoized), so it is left untouched
+    filename = endpoint_filename(spec.path, options.output_prefix).rsplit("/", 1)[-1]
+
+    split = split_model(root) if options.split_queries else None
+    queried = {"": split.base if split else root}
+    if split:
+        queried.update((branch.name, partial) for branch, partial in split.branches)
+    representations = (
+        {
+            name: serialize_query_representation(
+                clone, options.prefixes, options.optimize
+            )
+            for name, clone in queried.items()
+        }
+        if options.field_projection
+        else {}
+    )
+
+    partials = (
+        (split.base, *(partial for _branch, partial in split.branches)) if split else ()
+    )
+    branches = tuple(branch for branch, _partial in split.branches) if split else ()
+    if options.shared_models:
+        # the classes are emitted into the shared module, the endpoint module re-exports them under names
+        # that are unique to the endpoint (the entry point imports the models of all endpoints)
+        class_name = path_to_camelcase(spec.path)
+        branches = tuple(
+            replace(
+                branch,
+                class_name=class_name + branch.class_name[len(root.class_name) :],
+            )
+            for branch in branches
+        )
+        models, indexes = model_table(root, *partials)
+        exports = tuple(
+            (index, class_name + clone.class_name[len(root.class_name) :])
+            for clone, index in zip((root, *partials), indexes)
+        )
+        model = None
+    else:
+        class_name = root.class_name
+        models, exports = (), ()
+        model = serialize_model(root, *partials)
+
+    return GeneratedEndpoint(
+        path=spec.path,
+        filename=filename,
+        class_name=class_name,
+        binding=root.binding,
+        details=spec.path.endswith("details"),
+        model=model,
+        query=serialize_query(
+            split.base if split else root, options.prefixes, options.optimize
+        ),
+        branches=branches,
+        branch_queries={
+            branch.name: serialize_query(partial, options.prefixes, options.optimize)
+            for branch, partial in (split.branches if split else ())
+        },
+        projection=options.field_projection,
+        representations=representations,
+        models=tuple(models),
+        exports=exports,
+    )
+
+
+# state of pool worker processes, the parsed paths are only transferred once per worker
+_worker_paths = None
+_worker_options = None
+_worker_memo = {}
+
+
+def _init_worker(paths, options):
+    """Sets up a worker with the paths (if it was forked) or the records of the paths, which it nests itself"""
+    global _worker_paths, _worker_options
+    if not isinstance(paths, PathIndex):
+        _root_types, paths = nest_paths(paths_from_records(paths))
+    _worker_paths = paths
+    _worker_options = options
+
+
+def _generate_in_worker(spec):
+    return generate_endpoint(_worker_paths, spec, _worker_options, _worker_memo)
+
+
+def generate_endpoints(
+    paths,
+    specs: list[EndpointSpec],
+    options: GenerationOptions,
+    jobs=1,
+    manifest: Manifest | None = None,
+) -> list[GeneratedEndpoint]:
+    """Generates all endpoints, in the order of the specs. With jobs > 1, the endpoints are cloned and
+    serialized by a pool of worker processes.
+
+    If a manifest is given, endpoints whose inputs are unchanged since they were recorded in it (and whose
+    output files still exist) are not regenerated, their model and query are None. With shared models, all
+    endpoints are regenerated. The manifest is updated with the input hashes of all endpoints but not saved.
+    """
+    if manifest is None:
+        return _generate_endpoints(paths, specs, options, jobs)
+
+    version = template_version()
+    memo = {}
+    hashes = {
+        spec.path: endpoint_input_hash(paths, spec, options, version, memo)
+        for spec in specs
+    }
+    unchanged = {}
+    for spec in specs if not options.shared_models else ():
+        filename = endpoint_filename(spec.path, options.output_prefix)
+        entry = manifest.unchanged(spec.path, hashes[spec.path])
+        if entry and all(
+            pathlib.Path(output_file).exists()
+            for output_file in output_files(filename, entry.branches, entry.projection)
+        ):
+            logging.info(f"endpoint {spec.path} is unchanged, not regenerating it")
+            unchanged[spec.path] = GeneratedEndpoint(
+                spec.path,
+                entry.filename,
+                entry.class_name,
+                entry.binding,
+                entry.details,
+                None,
+                None,
+                entry.branches,
+                projection=entry.projection,
+            )
+
+    generated = iter(
+        _generate_endpoints(
+            paths, [spec for spec in specs if spec.path not in unchanged], options, jobs
+        )
+    )
+    endpoints = [unchanged.get(spec.path) or next(generated) for spec in specs]
+    for endpoint in endpoints:
+        manifest.update(endpoint, hashes[endpoint.path])
+    return endpoints
+
+
+def _generate_endpoints(paths, specs, options, jobs):
+    if jobs <= 1 or len(specs) <= 1:
+        # clones of identical subtrees are shared between endpoints
+        memo = {}
+        return [generate_endpoint(paths, spec, options, memo) for spec in specs]
+
+    # forked workers inherit the parsed paths, other ones get their records instead of the nested paths (which
+    # can't be pickled once they refer to each other too deeply). Workers only return plain data.
+    fork = "fork" in multiprocessing.get_all_start_methods()
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(specs)),
+        mp_context=multiprocessing.get_context("fork") if fork else None,
+        initializer=_init_worker,
+        initargs=(paths if fork else path_records(paths.values()), options),
+    ) as executor:
+        return list(executor.map(_generate_in_worker, specs))
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import pathlib
+from dataclasses import asdict, dataclass, field
+
+from wisskas.split import Branch
+
+# bump whenever the manifest layout or the input hashing changes
+MANIFEST_FORMAT = 4
+
+
+def path_signature(path) -> tuple:
+    """The parts of a (non-cloned) WissKIPath that affect the generated code"""
+    return (
+        path.id,
+        tuple(path.path_array),
+        path.cardinality,
+        path.group_id,
+        path.datatype_property,
+        path.fieldtype,
+        path.name,
+        path.rdf_class,
+        path.class_name,
+        path.type,
+        path.entity_reference.id if path.entity_reference else None,
+        tuple(path.fields),
+    )
+
+
+def changed_paths(old, new) -> set[str]:
+    """The ids of the paths that were added, removed or changed (in a way that affects the generated code)
+    between two PathIndexes"""
+    return {
+        path_id
+        for path_id in old.keys() | new.keys()
+        if path_id not in old
+        or path_id not in new
+        or path_signature(old[path_id]) != path_signature(new[path_id])
+    }
+
+
+def group_hash(path, memo: dict) -> bytes:
+    """Hashes the path and all of its fields (recursively), without following entity references"""
+    if path.id not in memo:
+        digest = hashlib.sha256(repr(path_signature(path)).encode())
+        for field in path.fields.values():
+            digest.update(group_hash(field, memo))
+        memo[path.id] = digest.digest()
+    return memo[path.id]
+
+
+def subtree_hash(root, paths, memo=None) -> str:
+    """Hashes all paths reachable from root via fields and entity references. The hashes of the groups and of
+    the sets of root types they refer to are kept in the memo, so that they are only computed once for all
+    endpoints"""
+    memo = {} if memo is None else memo
+    closure = paths.closure(root.id)
+    if closure not in memo:
+        digest = hashlib.sha256()
+        for root_id in sorted(closure):
+            digest.update(group_hash(paths[root_id], memo))
+        memo[closure] = digest.digest()
+    return hashlib.sha256(group_hash(root, memo) + memo[closure]).hexdigest()
+
+
+def endpoint_input_hash(paths, spec, options, template_version: str, memo=None) -> str:
+    """Hashes everything that the generated model and query of an endpoint depend on"""
+    digest = hashlib.sha256()
+    digest.update(repr((MANIFEST_FORMAT, template_version, spec, options)).encode())
+    digest.update(subtree_hash(paths[spec.path_id], paths, memo).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class ManifestEntry:
+    input_hash: str
+    filename: str
+    class_name: str
+    binding: str
+    details: bool
+    branches: tuple[Branch, ...] = ()
+    projection: bool = False
+
+    def __post_init__(self):
+        # branches are stored as JSON objects
+        self.branches = tuple(
+            branch
+            if isinstance(branch, Branch)
+            else Branch(branch["name"], tuple(branch["path"]), branch["class_name"])
+            for branch in self.branches
+        )
+
+
+@dataclass
+class Manifest:
+    """Records the input hashes and entry point metadata of the endpoints that were written to disk"""
+
+    filename: pathlib.Path
+    endpoints: dict[str, ManifestEntry] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, filename: pathlib.Path | str) -> "Manifest":
+        filename = pathlib.Path(filename)
+        try:
+            data = json.loads(filename.read_text())
+            if data["format"] != MANIFEST_FORMAT:
+                raise ValueError(f"unsupported manifest format {data['format']}")
+            endpoints = {
+                path: ManifestEntry(**entry)
+                for path, entry in data["endpoints"].items()
+            }
+        except FileNotFoundError:
+            return cls(filename)
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f"ignoring invalid manifest {filename}: {e}")
+            return cls(filename)
+        return cls(filename, endpoints)
+
+    def unchanged(self, endpoint_path: str, input_hash: str) -> ManifestEntry | None:
+        """Returns the manifest entry of the endpoint if its inputs haven't changed since it was recorded"""
+        entry = self.endpoints.get(endpoint_path)
+        return entry if entry and entry.input_hash == input_hash else None
+
+    def update(self, endpoint, input_hash: str):
+        self.endpoints[endpoint.path] = ManifestEntry(
+            input_hash,
+            endpoint.filename,
+            endpoint.class_name,
+            endpoint.binding,
+            endpoint.details,
+            endpoint.branches,
+            endpoint.projection,
+        )
+
+    def save(self, endpoint_paths=None):
+        """Writes the manifest, only keeping the given endpoints (default: all)"""
+        endpoints = {
+            path: asdict(entry)
+            for path, entry in self.endpoints.items()
+            if endpoint_paths is None or path in endpoint_paths
+        }
+        content = json.dumps(
+            {"format": MANIFEST_FORMAT, "endpoints": endpoints}, indent=2
+        )
+        write_if_changed(content, self.filename)
+
+
+def write_if_changed(content: str, filename: pathlib.Path | str) -> bool:
+    """Writes the content to the file unless it already has exactly this content. Returns whether it was written"""
+    filename = pathlib.Path(filename)
+    try:
+        if filename.read_text() == content:
+            logging.info(f"{filename} is unchanged")
+            return False
+    except FileNotFoundError:
+        pass
+    filename.write_text(content)
+    return True
@@ -0,0 +1,204 @@
+"""Per-endpoint instrumentation of generated apps. The time spent on a request is split into phases, which are
+recorded (from any thread or task working on the request) into the Timings of the current request context."""
+
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from collections import defaultdict
+
+# the phases of a request, in the order in which they happen
+PHASES = {
+    "sparql": "sending the queries until the SPARQL endpoint starts to respond (i.e. mostly query evaluation)",
+    "transfer": "receiving the query results",
+    "parse": "decoding the query results",
+    "models": "grouping the results and building the models (rdfproxy)",
+    "serialize": "serializing the response",
+    "total": "handling the request",
+}
+# seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Timings:
+    """The accumulated durations (in seconds) of all phases of a request, plus its number of result rows.
+    Phases can overlap, e.g. if several queries are sent at once."""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.rows = 0
+        self.lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self.lock:
+            self.durations[phase] += seconds
+
+    def add_rows(self, rows: int):
+        with self.lock:
+            self.rows += rows
+
+    def server_timing(self) -> str:
+        """The value of a Server-Timing header with all recorded phases"""
+        return ", ".join(
+            f"{phase};dur={self.durations[phase] * 1000:.1f}"
+            for phase in PHASES
+            if phase in self.durations
+        )
+
+
+current_timings: contextvars.ContextVar[Timings | None] = contextvars.ContextVar(
+    "current_timings", default=None
+)
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    """Records the duration of the block as the given phase of the current request (if it is instrumented)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = current_timings.get()
+        if timings is not None:
+            timings.add(name, time.perf_counter() - start)
+
+
+def record(name: str, seconds: float):
+    """Records a duration that was measured elsewhere as the given phase of the current request"""
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def count_rows(rows: int):
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add_rows(rows)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labels(**values) -> str:
+    if not values:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{escape(value)}"' for name, value in values.items())
+        + "}"
+    )
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, **label_values) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            cumulative += count
+            lines.append(
+                f"{name}_bucket{labels(**label_values, le=bound)} {cumulative}"
+            )
+        lines.append(f"{name}_sum{labels(**label_values)} {self.sum}")
+        lines.append(f"{name}_count{labels(**label_values)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """Collects the metrics of all endpoints of an app, which are rendered in the Prometheus text format.
+
+    Gauges are registered as functions that return the current values by label values, so that they are
+    only computed when the metrics are scraped."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.requests = defaultdict(int)
+        self.rows = defaultdict(int)
+        self.latencies = defaultdict(lambda: Histogram(self.buckets))
+        self.in_flight = defaultdict(int)
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.gauge(
+            "wisskas_requests_in_flight",
+            "requests that are being handled",
+            lambda: {(("endpoint", e),): n for e, n in self.in_flight.items()},
+        )
+
+    def gauge(self, name: str, description: str, function, kind="gauge"):
+        """Registers a gauge (or a counter that is kept elsewhere), the function returns a number or a dict
+        with the values by (tuples of) labels"""
+        self.gauges[name] = (description, function, kind)
+
+    @contextlib.contextmanager
+    def request(self, endpoint: str):
+        """Instruments the handling of a request to an endpoint, the Timings are recorded when the block exits"""
+        timings = Timings()
+        token = current_timings.set(timings)
+        with self.lock:
+            self.in_flight[endpoint] += 1
+        start = time.perf_counter()
+        status = {"code": 500}
+        try:
+            yield timings, status
+        finally:
+            timings.add("total", time.perf_counter() - start)
+            current_timings.reset(token)
+            with self.lock:
+                self.in_flight[endpoint] -= 1
+                self.requests[endpoint, status["code"]] += 1
+                self.rows[endpoint] += timings.rows
+                for name, seconds in timings.durations.items():
+                    self.latencies[endpoint, name].observe(seconds)
+
+    def render(self) -> str:
+        lines = []
+
+        def add_metric(name, kind, description):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            add_metric("wisskas_requests_total", "counter", "handled requests")
+            for (endpoint, code), count in sorted(self.requests.items()):
+                lines.append(
+                    f"wisskas_requests_total{labels(endpoint=endpoint, code=code)} {count}"
+                )
+            add_metric(
+                "wisskas_result_rows_total",
+                "counter",
+                "result rows of the items queries",
+            )
+            for endpoint, rows in sorted(self.rows.items()):
+                lines.append(
+                    f"wisskas_result_rows_total{labels(endpoint=endpoint)} {rows}"
+                )
+            add_metric(
+                "wisskas_request_phase_seconds",
+                "histogram",
+                "time spent per phase of a request: "
+                + ", ".join(f"{name} ({text})" for name, text in PHASES.items()),
+            )
+            for (endpoint, name), histogram in sorted(self.latencies.items()):
+                lines.extend(
+                    histogram.render(
+                        "wisskas_request_phase_seconds", endpoint=endpoint, phase=name
+                    )
+                )
+            for name, (description, function, kind) in self.gauges.items():
+                add_metric(name, kind, description)
+                values = function()
+                if not isinstance(values, dict):
+                    values = {(): values}
+                for label_values, value in values.items():
+                    lines.append(f"{name}{labels(**dict(label_values))} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,108 @@
+import copy
+import heapq
+from collections import defaultdict
+
+from wisskas.sparql import GroupPattern, SelectQuery, Triple, Variable
+
+
+def optimize(query: SelectQuery) -> SelectQuery:
+    """Returns an optimized copy of the query with the same projection and the same solutions.
+
+    - required child patterns are merged into their parent's group, so that all required patterns of a group
+      come before its OPTIONAL blocks
+    - triple patterns (including type patterns) that are already required by the same or an enclosing group
+      are removed
+    - the triple patterns of every group are ordered so that every pattern joins with already bound variables,
+      the most selective (fewest unbound variables) first
+    """
+    where = copy.deepcopy(query.where)
+    flatten(where)
+    remove_redundant(where, set())
+    order(where, set())
+    return SelectQuery(where, list(query.projection), dict(query.prefixes))
+
+
+def flatten(pattern: GroupPattern):
+    """Moves the triples of required children into the pattern, leaving only OPTIONAL children"""
+    children = []
+    for child in pattern.children:
+        flatten(child)
+        if child.optional:
+            children.append(child)
+        else:
+            pattern.triples.extend(child.triples)
+            children.extend(child.children)
+    pattern.children = children
+
+
+def remove_redundant(pattern: GroupPattern, required: set[Triple]):
+    """Removes triples that are already required, as well as OPTIONAL blocks that end up empty"""
+    required = set(required)
+    triples = []
+    for triple in pattern.triples:
+        if triple not in required:
+            required.add(triple)
+            triples.append(triple)
+    pattern.triples = triples
+    for child in pattern.children:
+        remove_redundant(child, required)
+    pattern.children = [
+        child for child in pattern.children if child.triples or child.children
+    ]
+
+
+def order(pattern: GroupPattern, bound: set[Variable]):
+    pattern.triples, bound = order_triples(pattern.triples, bound)
+    for child in pattern.children:
+        order(child, bound)
+
+
+def order_triples(
+    triples: list[Triple], bound: set[Variable]
+) -> tuple[list[Triple], set[Variable]]:
+    """Greedily orders triples by their number of unbound variables, only considering triples that share a
+    variable with the ones that came before (unless there are none). Returns the ordered triples and all
+    variables bound by them."""
+    bound = set(bound)
+    by_variable = defaultdict(list)
+    for i, triple in enumerate(triples):
+        for variable in variables(triple):
+            by_variable[variable].append(i)
+
+    def unbound(i):
+        return sum(variable not in bound for variable in variables(triples[i]))
+
+    # (number of unbound variables, original position), entries are pushed again when a variable gets bound
+    ready = [
+        (unbound(i), i)
+        for i, triple in enumerate(triples)
+        if any(variable in bound for variable in variables(triple))
+    ]
+    heapq.heapify(ready)
+    placed = [False] * len(triples)
+    ordered = []
+    next_unplaced = 0
+    while len(ordered) < len(triples):
+        if not ready:
+            # start a new connected component
+            while placed[next_unplaced]:
+                next_unplaced += 1
+            ready.append((unbound(next_unplaced), next_unplaced))
+        rank, i = heapq.heappop(ready)
+        if placed[i] or rank != unbound(i):
+            continue
+        placed[i] = True
+        ordered.append(triples[i])
+        for variable in variables(triples[i]):
+            if variable not in bound:
+                bound.add(variable)
+                for j in by_variable[variable]:
+                    if not placed[j]:
+                        heapq.heappush(ready, (unbound(j), j))
+    return ordered, bound
+
+
+def variables(triple: Triple):
+    yield triple.subject
+    if isinstance(triple.object, Variable):
+        yield triple.object
@@ -0,0 +1,198 @@
+"""Request-time field projection for generated apps: prunes an endpoint's query and model to the fields that
+a client asked for, using the same filterspec syntax as --endpoint-include-fields."""
+
+import functools
+import json
+import types
+import typing
+from typing import Annotated
+
+from pydantic import BaseModel, create_model
+
+from wisskas.optimize import optimize
+from wisskas.sparql import (
+    GroupPattern,
+    SelectQuery,
+    Serializer,
+    query_from_json,
+)
+from wisskas.string_utils import normalize_filterspec, parse_filterspec
+
+FIELDS_SEPARATOR = ","
+
+
+def parse_fields(fields: str) -> tuple[str, ...]:
+    """Parses the value of a fields= request parameter, e.g. 'name,birth.date,death.*'"""
+    return normalize_filterspec(
+        field.strip() for field in fields.split(FIELDS_SEPARATOR) if field.strip()
+    )
+
+
+def required_part(pattern: GroupPattern) -> GroupPattern:
+    """The part of a pattern that constrains its parent's solutions, i.e. everything that isn't OPTIONAL"""
+    return GroupPattern(
+        pattern.name,
+        pattern.variable,
+        pattern.triples,
+        [required_part(child) for child in pattern.children if not child.optional],
+        pattern.optional,
+    )
+
+
+def prune_pattern(
+    pattern: GroupPattern, filters: dict[str, list[str]], projection: list
+) -> GroupPattern:
+    """Removes the patterns of all fields that aren't selected by the (parsed) filterspec, appending the
+    variables of the remaining ones to the projection.
+
+    Required patterns of fields that aren't selected are kept (without projecting them), so that a projection
+    never changes which entities are returned."""
+    projection.append(pattern.variable)
+    if "**" in filters:
+        projection.extend(list(pattern.variables())[1:])
+        return pattern
+    children = []
+    for child in pattern.children:
+        if "*" in filters or child.name in filters:
+            children.append(
+                prune_pattern(
+                    child, parse_filterspec(filters.get(child.name, [])), projection
+                )
+            )
+        elif not child.optional:
+            children.append(required_part(child))
+    return GroupPattern(
+        pattern.name, pattern.variable, pattern.triples, children, pattern.optional
+    )
+
+
+def prune_annotation(annotation, prune):
+    """Replaces the models in a (list, union or plain) type annotation with their pruned version"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return prune(annotation)
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is list:
+        return list[prune_annotation(args[0], prune)]
+    if origin in (typing.Union, types.UnionType):
+        return typing.Union[tuple(prune_annotation(arg, prune) for arg in args)]
+    return annotation
+
+
+def nested_models(annotation) -> list[type[BaseModel]]:
+    """The models in a (list, union or plain) type annotation"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return [annotation]
+    return [
+        model for arg in typing.get_args(annotation) for model in nested_models(arg)
+    ]
+
+
+def check_fields(model: type[BaseModel], filters: dict[str, list[str]], path=()):
+    """Raises a ValueError if the (parsed) filterspec selects a field that the model doesn't have"""
+    for name, subfilters in filters.items():
+        if name in ("*", "**"):
+            continue
+        fieldname = ".".join((*path, name))
+        if name not in model.model_fields:
+            raise ValueError(f"unknown field: {fieldname}")
+        if not subfilters:
+            continue
+        models = nested_models(model.model_fields[name].annotation)
+        if not models:
+            raise ValueError(f"field has no nested fields: {fieldname}")
+        for nested in models:
+            check_fields(nested, parse_filterspec(subfilters), (*path, name))
+
+
+def prune_model(model: type[BaseModel], filters: dict[str, list[str]]):
+    """Creates a copy of a model that only has the fields selected by the (parsed) filterspec, plus its id"""
+    if "**" in filters:
+        return model
+    fields = {}
+    for name, info in model.model_fields.items():
+        if name != "id" and "*" not in filters and name not in filters:
+            continue
+        subfilters = parse_filterspec(filters.get(name, []))
+        annotation = prune_annotation(
+            info.annotation, functools.partial(prune_model, filters=subfilters)
+        )
+        if info.metadata:
+            annotation = Annotated[annotation, *info.metadata]
+        fields[name] = (annotation, ... if info.is_required() else info.default)
+    return create_model(
+        model.__name__,
+        __config__=model.model_config,
+        __module__=model.__module__,
+        **fields,
+    )
+
+
+def selects(filters: dict[str, list[str]], path) -> bool:
+    """Whether the (parsed) filterspec selects the field at the given path"""
+    for fieldname in path:
+        if "**" in filters:
+            return True
+        if "*" not in filters and fieldname not in filters:
+            return False
+        filters = parse_filterspec(filters.get(fieldname, []))
+    return True
+
+
+class Projection:
+    """Creates (and caches) the pruned query and model of an endpoint for every requested projection.
+
+    For the query of a list-valued branch (see wisskas.split), the path of the branch is given and no query
+    is created if the projection doesn't select the branch. The requested fields are checked against the
+    schema, i.e. the complete model of the endpoint (default: the model)."""
+
+    def __init__(
+        self,
+        query: SelectQuery,
+        model: type[BaseModel],
+        branch_path=(),
+        optimize=True,
+        maxsize=128,
+        schema: type[BaseModel] | None = None,
+    ):
+        self.query = query
+        self.model = model
+        self.schema = schema or model
+        self.branch_path = tuple(branch_path)
+        self.optimize = optimize
+        self.project = functools.lru_cache(maxsize)(self._project)
+
+    @classmethod
+    def load(cls, filename, model: type[BaseModel], branch_path=(), **kwargs):
+        """Loads the query representation written by `wisskas endpoints --field-projection`"""
+        with open(filename) as f:
+            data = json.load(f)
+        return cls(
+            query_from_json(data["query"]),
+            model,
+            branch_path,
+            data["optimize"],
+            **kwargs,
+        )
+
+    def __call__(self, fields: str | None) -> tuple[str | None, type[BaseModel] | None]:
+        """Returns the query and model for the fields= parameter of a request (all fields if it's None), raises
+        a ValueError if it selects no or unknown fields"""
+        return self.project(None if fields is None else parse_fields(fields))
+
+    def _project(self, filterspec):
+        if filterspec is None:
+            filters = {"**": []}
+        else:
+            if not filterspec:
+                raise ValueError("no fields given")
+            filters = parse_filterspec(filterspec)
+            check_fields(self.schema, filters)
+            if not selects(filters, self.branch_path):
+                return None, None
+        projection = []
+        where = prune_pattern(self.query.where, filters, projection)
+        query = SelectQuery(where, projection, self.query.prefixes)
+        if self.optimize:
+            query = optimize(query)
+        return Serializer(query).serialize(), prune_model(self.model, filters)
@@ -0,0 +1,108 @@
+"""An in-memory cache for the (serialized) responses of generated apps. Cached responses are served without
+querying the SPARQL endpoint or validating any models again."""
+
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, TypeAdapter
+
+from wisskas.metrics import phase
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 300.0
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    content: bytes
+    etag: str
+    expires: float
+
+    def response(self, if_none_match: str | None = None) -> Response:
+        """The response to a request with the given If-None-Match header, 304 if the client's copy is current"""
+        if if_none_match is not None and etag_matches(if_none_match, self.etag):
+            return Response(status_code=304, headers={"ETag": self.etag})
+        return Response(
+            self.content, media_type="application/json", headers={"ETag": self.etag}
+        )
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def cache_key(endpoint: str, params: BaseModel | None = None, **values) -> tuple:
+    """Identifies a request to an endpoint, independent of the order (or omission) of default parameters"""
+    if params is not None:
+        values = {**params.model_dump(mode="json"), **values}
+    return (endpoint, json.dumps(values, sort_keys=True))
+
+
+@functools.lru_cache(maxsize=None)
+def type_adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def encode(result, model=None) -> bytes:
+    """Serializes a handler's result like FastAPI would, validating it against the response model (if any)"""
+    with phase("serialize"):
+        if model is None:
+            return json.dumps(jsonable_encoder(result)).encode()
+        adapter = type_adapter(model)
+        return adapter.dump_json(adapter.validate_python(result), by_alias=True)
+
+
+class ResponseCache:
+    """LRU cache of serialized responses that expire after a time-to-live (in seconds, 0 for never)"""
+
+    def __init__(
+        self, maxsize: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> CachedResponse | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires < time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, content: bytes) -> CachedResponse:
+        etag = f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+        expires = time.monotonic() + self.ttl if self.ttl else float("inf")
+        entry = CachedResponse(content, etag, expires)
+        if self.maxsize <= 0:
+            return entry
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self) -> int:
+        """Drops all cached responses (e.g. after the triplestore was synced), returns how many there were"""
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+        return count
@@ -0,0 +1,173 @@
+"""Helpers for the FastAPI apps generated by wisskas. This module is imported by the generated code at
+request time, so it must stay free of the generator's (heavy) imports."""
+
+import asyncio
+import functools
+import logging
+import re
+import threading
+import time
+
+# characters that aren't allowed in SPARQL IRI references
+_INVALID_IRI = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+_WHERE = re.compile(r"\bWHERE\s*\{", re.IGNORECASE)
+
+# uvicorn only shows the messages of its own loggers by default
+logger = logging.getLogger("uvicorn.error")
+
+
+def load_queries(directory, names) -> dict[str, str]:
+    """Reads the generated queries with the given names from the directory, collapsing their indentation"""
+    queries = {}
+    for name in names:
+        with open(f"{directory}/{name}.rq") as f:
+            queries[name] = f.read().replace("\n ", " ")
+    return queries
+
+
+def iri_ref(value) -> str:
+    """Formats a value as a SPARQL IRI reference, raises a ValueError if it isn't a valid IRI"""
+    value = str(value)
+    if not value or _INVALID_IRI.search(value):
+        raise ValueError(f"not a valid IRI: {value!r}")
+    return f"<{value}>"
+
+
+def bind_values(query: str, variable: str, values) -> str:
+    """Restricts the solutions of a (generated) query to the ones where the variable is one of the given IRIs"""
+    match = _WHERE.search(query)
+    if match is None:
+        raise ValueError("query has no WHERE clause")
+    clause = (
+        f"\n  VALUES ?{variable} {{ {' '.join(iri_ref(value) for value in values)} }}"
+    )
+    return query[: match.end()] + clause + query[match.end() :]
+
+
+def merge_branch(items: list[dict], path, branch_items: list[dict]):
+    """Sets the list-valued field at the given path of every (dumped) item to its values in the branch item
+    with the same id. Items without a branch item get an empty list, nested objects that are missing from an
+    item are taken from its branch item (or created empty)."""
+    branch_items = {str(item["id"]): item for item in branch_items}
+    for item in items:
+        source = branch_items.get(str(item["id"]))
+        target = item
+        for fieldname in path[:-1]:
+            source = source.get(fieldname) if source else None
+            if target.get(fieldname) is None:
+                target[fieldname] = dict(source) if source else {}
+            target = target[fieldname]
+        target[path[-1]] = (source.get(path[-1]) or []) if source else []
+
+
+def limit(concurrency: int):
+    """Decorates a coroutine function so that at most `concurrency` calls of it run at once (0 for no limit)"""
+
+    def decorator(function):
+        if not concurrency:
+            return function
+        semaphore = asyncio.Semaphore(concurrency)
+
+        @functools.wraps(function)
+        async def limited(*args, **kwargs):
+            async with semaphore:
+                return await function(*args, **kwargs)
+
+        return limited
+
+    return decorator
+
+
+class Coalescer:
+    """Lets concurrent requests with the same key share the result of the first one, instead of each querying
+    the SPARQL endpoint"""
+
+    def __init__(self):
+        self.pending: dict[object, asyncio.Future] = {}
+
+    async def run(self, key, function):
+        """Awaits function() unless there already is a pending call for the key, in which case its result is
+        awaited instead"""
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(function())
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        # cancelling one request mustn't cancel the call that the others are waiting for
+        return await asyncio.shield(future)
+
+
+class StartupTimings:
+    """The durations (in seconds) of the phases of an app's startup, every phase lasts from the end of the
+    previous one (or the given start time) until it is recorded"""
+
+    def __init__(self, start: float):
+        self.last = start
+        self.phases: dict[str, float] = {}
+
+    def phase(self, name: str):
+        now = time.perf_counter()
+        self.phases[name] = now - self.last
+        self.last = now
+
+    def __str__(self):
+        return ", ".join(
+            f"{name} {seconds * 1000:.0f}ms"
+            for name, seconds in [
+                *self.phases.items(),
+                ("total", sum(self.phases.values())),
+            ]
+        )
+
+
+class LazyRoute:
+    """An ASGI app that creates the actual (FastAPI) route of an endpoint the first time it is needed, which
+    is when its models are imported. The number of seconds that took is kept."""
+
+    def __init__(self, name: str, load):
+        self.name = name
+        self._load = load
+        self.route = None
+        self.seconds: float | None = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Returns the route, which is only created once (by whichever thread gets here first)"""
+        if self.route is None:
+            with self.lock:
+                if self.route is None:
+                    start = time.perf_counter()
+                    route = self._load()
+                    self.seconds = time.perf_counter() - start
+                    logger.info(f"loaded {self.name} in {self.seconds * 1000:.0f}ms")
+                    self.route = route
+        return self.route
+
+    async def __call__(self, scope, receive, send):
+        route = self.route
+        if route is None:
+            # building the models takes a while, which mustn't block the other requests
+            route = await asyncio.to_thread(self.load)
+        await route.app(scope, receive, send)
+
+
+def warm_up(routes) -> threading.Thread:
+    """Loads the given lazy routes one after the other in a background thread, so that (most) requests don't
+    have to wait for it"""
+    routes = list(routes)
+
+    def run():
+        start = time.perf_counter()
+        for route in routes:
+            try:
+                route.load()
+            except Exception:
+                # it is tried again on the first request
+                logger.exception(f"loading {route.name} failed")
+        logger.info(
+            f"loaded {len(routes)} endpoints in {time.perf_counter() - start:.1f}s"
+        )
+
+    thread = threading.Thread(target=run, name="wisskas-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -1,32 +1,284 @@
-from jinja2 import Environment, PackageLoader, select_autoescape
+import functools
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+from dataclasses import dataclass, replace
+from importlib.resources import files
 
-env = Environment(loader=PackageLoader("wisskas"), autoescape=select_autoescape())
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    PackageLoader,
+    select_autoescape,
+)
 
-# add support for any/all filters
-env.filters["any"] = any
-env.filters["all"] = all
+from wisskas.cache import wisskas_version
+from wisskas.optimize import optimize as optimize_query
+from wisskas.sparql import Serializer, build_query, query_to_json
+
+# compiled templates are cached in this directory (if set), so they only need to be compiled once
+_bytecode_cache_dir = None
+
+
+def set_bytecode_cache_dir(cache_dir: pathlib.Path | None):
+    global _bytecode_cache_dir
+    _bytecode_cache_dir = cache_dir
+
+
+@functools.cache
+def environment(bytecode_cache_dir: pathlib.Path | None = None) -> Environment:
+    """Creates the Jinja environment on first use (per bytecode cache directory)"""
+    bytecode_cache = None
+    if bytecode_cache_dir:
+        try:
+            bytecode_cache_dir.mkdir(parents=True, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        except OSError as e:
+            logging.warning(f"not caching compiled templates: {e}")
+
+    env = Environment(
+        loader=PackageLoader("wisskas"),
+        autoescape=select_autoescape(),
+        bytecode_cache=bytecode_cache,
+    )
+
+    # add support for any/all filters
+    env.filters["any"] = any
+    env.filters["all"] = all
+    return env
+
+
+def template_version() -> str:
+    """Hashes the wisskas version and the sources of all templates"""
+    digest = hashlib.sha256(wisskas_version().encode())
+    for template in sorted(
+        (files("wisskas") / "templates").iterdir(), key=lambda t: t.name
+    ):
+        digest.update(template.name.encode())
+        digest.update(template.read_bytes())
+    return digest.hexdigest()
 
 
 def serialize(template_name, **kwargs):
-    template = env.get_template(f"{template_name}.jinja")
+    template = environment(_bytecode_cache_dir).get_template(f"{template_name}.jinja")
     return template.render(**kwargs)
 
 
-def serialize_entrypoint(endpoints, backend_address, git_endpoint=False, cors={}):
+def serialize_entrypoint(
+    endpoints,
+    backend_address,
+    git_endpoint=False,
+    cors=None,
+    client=None,
+    cache=None,
+    concurrency=None,
+    metrics=False,
+    lazy=None,
+):
+    """Renders the FastAPI app for the given SPARQL endpoint (or list of replicas), whose handlers are async
+    if the concurrency options (max, endpoint and coalesce) are given. If the lazy options (the filename of
+    the pregenerated OpenAPI document) are given, the models of every endpoint are only imported when it is
+    first needed."""
+    if isinstance(backend_address, str):
+        backend_address = [backend_address]
+    client = client or {}
     return serialize(
         "entrypoint.py",
         **{
-            "backend_address": backend_address,
-            "cors": cors,
+            "backend_addresses": backend_address or [],
+            "cache": cache,
+            "concurrency": concurrency,
+            "metrics": metrics,
+            "lazy": lazy,
+            "client": {
+                "pool_size": client.get("pool_size"),
+                "connect_timeout": client.get("connect_timeout"),
+                "timeout": client.get("timeout"),
+                "failure_threshold": client.get("failure_threshold"),
+                "failure_cooldown": client.get("failure_cooldown"),
+            },
+            "cors": cors or {},
             "endpoints": endpoints,
             "git": git_endpoint,
         },
     )
 
 
-def serialize_model(root):
-    return serialize("model.py", **{"root": root})
+def openapi_document(entrypoint: str, filename) -> str:
+    """Returns the OpenAPI document of the given (eager) entry point as if it was the file with the given name,
+    next to the generated endpoints. It is run in a separate interpreter, so that the generator doesn't have to
+    import all models itself."""
+    filename = os.path.abspath(filename)
+    script = (
+        "import json, sys, types\n"
+        "sys.path.insert(0, sys.argv[1])\n"
+        "module = sys.modules['wisskas_openapi'] = types.ModuleType('wisskas_openapi')\n"
+        "module.__file__ = sys.argv[2]\n"
+        "exec(compile(sys.stdin.read(), sys.argv[2], 'exec'), module.__dict__)\n"
+        "print(json.dumps(module.app.openapi(), indent=2))\n"
+    )
+    try:
+        result = subprocess.run(
+            [sys.executable, "-c", script, os.path.dirname(filename), filename],
+            input=entrypoint,
+            capture_output=True,
+            text=True,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, sys.path))},
+            check=True,
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(
+            f"can't create the OpenAPI document of {filename}:\n{e.stderr}"
+        ) from e
+    return result.stdout
+
+
+def model_classes(*roots) -> list:
+    """Returns the (nested) classes of the given clones in definition order, i.e. every class right after
+    its nested classes. Class names aren't unique, so shared subtrees are deliberately repeated."""
+    classes = []
+
+    def add(clone):
+        for field in clone.fields.values():
+            if field.fields:
+                add(field)
+        classes.append(clone)
+
+    for root in roots:
+        add(root)
+    return classes
+
+
+def serialize_model(root, *partials):
+    """Serializes the model classes of the root clone, plus those of any partial models of it"""
+    return serialize("model.py", **{"classes": model_classes(root, *partials)})
+
+
+@dataclass(frozen=True)
+class ModelField:
+    """What is rendered for a field of a model class, nested classes are referred to by their index"""
+
+    binding: str | None
+    cardinality: int
+    type: str | None
+    class_name: str | None
+    nested: int | None = None
+
+
+@dataclass(frozen=True)
+class ModelClass:
+    """What is rendered for a model class. Unlike the clones it is rendered from, it is plain data that can
+    be passed between processes."""
+
+    class_name: str
+    name: str | None
+    root: bool
+    binding: str | None
+    fields: dict[str, ModelField]
+
+
+def model_table(*roots) -> tuple[list[ModelClass], list[int]]:
+    """Returns the (nested) classes of the given clones as ModelClasses in definition order, along with the
+    indexes of the roots. Shared subtrees only occur once."""
+    classes = []
+    indexes = {}
+
+    def add(clone) -> int:
+        if id(clone) not in indexes:
+            fields = {
+                fieldname: ModelField(
+                    field.binding,
+                    field.cardinality,
+                    field.type,
+                    field.class_name,
+                    add(field) if field.fields else None,
+                )
+                for fieldname, field in clone.fields.items()
+            }
+            indexes[id(clone)] = len(classes)
+            classes.append(
+                ModelClass(
+                    clone.class_name, clone.name, clone.root, clone.binding, fields
+                )
+            )
+        return indexes[id(clone)]
+
+    return classes, [add(root) for root in roots]
+
+
+def serialize_shared_models(endpoints, module_name: str) -> str:
+    """Returns a module with every structurally distinct model class of the endpoints (generated with shared
+    models), and sets the model of every endpoint to a module that imports its classes from it.
+
+    Classes are identified by a hash of everything that is rendered for them except their name, including the
+    hashes of their nested classes. Every class is named after its first occurrence, distinct classes with the
+    same name are numbered."""
+    names = {}
+    taken = set()
+    classes = []
+
+    for endpoint in endpoints:
+        # nested classes come before the classes they are nested in
+        digests = []
+        for model in endpoint.models:
+            signature = [model.name, model.root, model.binding]
+            for fieldname, field in model.fields.items():
+                signature.append(
+                    (
+                        fieldname,
+                        field.binding,
+                        field.cardinality,
+                        field.type,
+                        field.class_name
+                        if field.nested is None
+                        else digests[field.nested],
+                    )
+                )
+            digest = hashlib.sha256(repr(signature).encode()).hexdigest()
+            digests.append(digest)
+            if digest in names:
+                continue
+            name = model.class_name
+            n = 1
+            while name in taken:
+                n += 1
+                name = f"{model.class_name}_{n}"
+            names[digest] = name
+            taken.add(name)
+            classes.append(
+                replace(
+                    model,
+                    class_name=name,
+                    fields={
+                        fieldname: field
+                        if field.nested is None
+                        else replace(field, class_name=names[digests[field.nested]])
+                        for fieldname, field in model.fields.items()
+                    },
+                )
+            )
+
+        imports = [
+            f"{names[digests[index]]} as {alias}" for index, alias in endpoint.exports
+        ]
+        endpoint.model = (
+            f"from {module_name} import {', '.join(imports)}  # noqa: F401\n"
+        )
+    return serialize("model.py", classes=classes)
+
+
+def serialize_query(root, prefixes=None, optimize=True):
+    query = build_query(root, prefixes)
+    if optimize:
+        query = optimize_query(query)
+    return Serializer(query).serialize()
 
 
-def serialize_query(root, prefixes={}):
-    return serialize("query.rq", **{"root": root, "prefixes": prefixes})
+def serialize_query_representation(root, prefixes=None, optimize=True):
+    """Serializes the (unoptimized) query representation, for pruning it at request time"""
+    query = build_query(root, prefixes)
+    return json.dumps({"optimize": optimize, "query": query_to_json(query)})
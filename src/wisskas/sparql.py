@@ -0,0 +1,200 @@
+import re
+from dataclasses import dataclass, field
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+# local names that can be written as prefixed names without escaping
+_PN_LOCAL = re.compile(r"[\w][\w\-.]*(?<!\.)")
+
+
+@dataclass(frozen=True, slots=True)
+class Variable:
+    name: str
+
+
+@dataclass(frozen=True, slots=True)
+class IRI:
+    """An IRI, predicates starting with ^ denote inverse property paths"""
+
+    value: str
+
+
+@dataclass(frozen=True, slots=True)
+class Triple:
+    subject: Variable
+    predicate: IRI
+    object: Variable | IRI
+
+
+@dataclass(slots=True)
+class GroupPattern:
+    """The graph pattern of one (cloned) path, nested like the paths.
+
+    Children that aren't optional are joined with their parent's pattern when serialized (just like a SPARQL
+    group pattern without braces), optional ones become OPTIONAL blocks."""
+
+    name: str
+    variable: Variable
+    triples: list[Triple] = field(default_factory=list)
+    children: list["GroupPattern"] = field(default_factory=list)
+    optional: bool = False
+
+    def variables(self):
+        """The projected variables of this pattern and all its children, in pre-order"""
+        yield self.variable
+        for child in self.children:
+            yield from child.variables()
+
+
+@dataclass(slots=True)
+class SelectQuery:
+    where: GroupPattern
+    projection: list[Variable]
+    prefixes: dict[str, str] = field(default_factory=dict)
+
+
+def path_triples(clone) -> list[Triple]:
+    """The triples of a cloned path itself (without its fields)"""
+    triples = []
+    for i, step in enumerate(clone.path_array):
+        # parts of the path that already exist in the parent are None
+        if step is None:
+            continue
+        subject = Variable(clone.binding_vars[i // 2])
+        if i % 2 == 0:
+            triples.append(Triple(subject, IRI(RDF_TYPE), IRI(step)))
+        else:
+            triples.append(
+                Triple(subject, IRI(step), Variable(clone.binding_vars[i // 2 + 1]))
+            )
+    return triples
+
+
+def build_pattern(clone, name=None) -> GroupPattern:
+    """Creates the graph pattern for a cloned path (as created by wisskas.filter) and all of its fields.
+    Patterns are named after the field of their clone (the path id for the root)."""
+    pattern = GroupPattern(
+        name or clone.id,
+        Variable(clone.binding_vars[-1]),
+        path_triples(clone),
+        optional=clone.cardinality == -1,
+    )
+    pattern.children = [
+        build_pattern(child, fieldname) for fieldname, child in clone.fields.items()
+    ]
+    return pattern
+
+
+def build_query(root, prefixes: dict[str, str] | None = None) -> SelectQuery:
+    where = build_pattern(root)
+    # the root binding is what the results are grouped by, it's never optional
+    where.optional = False
+    return SelectQuery(where, list(where.variables()), dict(prefixes or {}))
+
+
+def term_to_json(term: Variable | IRI) -> str:
+    return f"?{term.name}" if isinstance(term, Variable) else term.value
+
+
+def term_from_json(value: str) -> Variable | IRI:
+    return Variable(value[1:]) if value.startswith("?") else IRI(value)
+
+
+def pattern_to_json(pattern: GroupPattern) -> dict:
+    return {
+        "name": pattern.name,
+        "variable": pattern.variable.name,
+        "triples": [
+            [term_to_json(term) for term in (t.subject, t.predicate, t.object)]
+            for t in pattern.triples
+        ],
+        "children": [pattern_to_json(child) for child in pattern.children],
+        "optional": pattern.optional,
+    }
+
+
+def pattern_from_json(data: dict) -> GroupPattern:
+    return GroupPattern(
+        data["name"],
+        Variable(data["variable"]),
+        [
+            Triple(*(term_from_json(term) for term in triple))
+            for triple in data["triples"]
+        ],
+        [pattern_from_json(child) for child in data["children"]],
+        data["optional"],
+    )
+
+
+def query_to_json(query: SelectQuery) -> dict:
+    """Converts a query to plain JSON data, so that it can be loaded (and modified) by generated apps"""
+    return {
+        "where": pattern_to_json(query.where),
+        "projection": [variable.name for variable in query.projection],
+        "prefixes": query.prefixes,
+    }
+
+
+def query_from_json(data: dict) -> SelectQuery:
+    return SelectQuery(
+        pattern_from_json(data["where"]),
+        [Variable(name) for name in data["projection"]],
+        data["prefixes"],
+    )
+
+
+class Serializer:
+    """Serializes a SelectQuery in a single pass, IRIs are shortened using the query's prefixes"""
+
+    def __init__(self, query: SelectQuery, indent: str = "  "):
+        self.query = query
+        self.indent = indent
+        self.namespaces = {uri: prefix for prefix, uri in query.prefixes.items()}
+
+    def iri(self, iri: IRI) -> str:
+        value = iri.value
+        if value == RDF_TYPE:
+            return "a"
+        inverse = "^" if value.startswith("^") else ""
+        value = value.removeprefix("^")
+        split = max(value.rfind("#"), value.rfind("/")) + 1
+        prefix = self.namespaces.get(value[:split])
+        if prefix is not None and _PN_LOCAL.fullmatch(value[split:]):
+            return f"{inverse}{prefix}:{value[split:]}"
+        return f"{inverse}<{value}>"
+
+    def term(self, term: Variable | IRI) -> str:
+        return f"?{term.name}" if isinstance(term, Variable) else self.iri(term)
+
+    def triple(self, triple: Triple) -> str:
+        return f"{self.term(triple.subject)} {self.iri(triple.predicate)} {self.term(triple.object)} ."
+
+    def group_lines(self, pattern: GroupPattern, depth: int, lines: list[str]):
+        indent = self.indent * depth
+        lines.extend(indent + self.triple(triple) for triple in pattern.triples)
+        for child in pattern.children:
+            if child.optional:
+                lines.append(f"{indent}OPTIONAL {{")
+                self.group_lines(child, depth + 1, lines)
+                lines.append(f"{indent}}}")
+            else:
+                self.group_lines(child, depth, lines)
+
+    def prefixes(self) -> str:
+        return "\n".join(
+            f"PREFIX {prefix}: <{uri}>" for prefix, uri in self.query.prefixes.items()
+        )
+
+    def projection(self) -> str:
+        return "\n".join(
+            f"{self.indent}?{variable.name}" for variable in self.query.projection
+        )
+
+    def where(self) -> str:
+        lines = []
+        self.group_lines(self.query.where, 1, lines)
+        return "\n".join(lines)
+
+    def serialize(self) -> str:
+        prefixes = f"{self.prefixes()}\n\n" if self.query.prefixes else ""
+        return f"{prefixes}SELECT\n{self.projection()}\nWHERE {{\n{self.where()}\n}}"
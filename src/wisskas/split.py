@@ -0,0 +1,78 @@
+import copy
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Branch:
+    """A list-valued field that is queried separately from the rest of an endpoint's model"""
+
+    # suffix of the query file and of the partial model's class names
+    name: str
+    # field names leading from the endpoint root to the list-valued field
+    path: tuple[str, ...]
+    class_name: str
+
+
+@dataclass
+class SplitModel:
+    """The partial models of an endpoint whose list-valued fields are queried separately.
+
+    The base model contains all fields except for the list-valued branches, every branch model only contains
+    the fields leading to one of the branches. Both are clones of the endpoint root with renamed classes."""
+
+    base: object
+    branches: list[tuple[Branch, object]]
+
+
+def list_branches(clone, path=()):
+    """Yields the paths to all list-valued fields that aren't nested in another list-valued field"""
+    for fieldname, field in clone.fields.items():
+        if field.cardinality == -1:
+            yield (*path, fieldname)
+        elif field.fields:
+            yield from list_branches(field, (*path, fieldname))
+
+
+def partial_clone(clone, suffix, fields):
+    """Shallow copy of a clone with different fields, its class is renamed so that it can live in the same
+    module as the complete model"""
+    partial = copy.copy(clone)
+    partial.fields = fields
+    partial.class_name = f"{clone.class_name}__{suffix}"
+    return partial
+
+
+def without_branches(clone, paths, suffix="base"):
+    fields = {}
+    for fieldname, field in clone.fields.items():
+        subpaths = {path[1:] for path in paths if path[0] == fieldname}
+        if () in subpaths:
+            continue
+        if subpaths:
+            field = without_branches(field, subpaths, suffix)
+            # nested objects that only consist of branches are left to the branch queries
+            if not field.fields:
+                continue
+        fields[fieldname] = field
+    return partial_clone(clone, suffix, fields)
+
+
+def only_branch(clone, path, suffix):
+    if not path:
+        return clone
+    return partial_clone(
+        clone, suffix, {path[0]: only_branch(clone.fields[path[0]], path[1:], suffix)}
+    )
+
+
+def split_model(root) -> SplitModel | None:
+    """Splits the model of an endpoint root clone at its list-valued fields, returns None if there are none"""
+    paths = list(list_branches(root))
+    if not paths:
+        return None
+    branches = []
+    for path in paths:
+        name = "__".join(path)
+        partial = only_branch(root, path, name)
+        branches.append((Branch(name, path, partial.class_name), partial))
+    return SplitModel(without_branches(root, paths), branches)
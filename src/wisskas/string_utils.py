@@ -26,9 +26,15 @@ def parse_endpointspec(pathid_endpointname) -> tuple[str, str]:
 
 
 def parse_filterspec(filterspec):
-    split = [i.split(FILTER_PATH_SEPARATOR, 1) for i in filterspec]
-    prefixes = set(p for p, *_r in split)
-    return {p: [r[1] for r in split if r[0] == p and len(r) > 1] for p in prefixes}
+    filters = {}
+    for spec in filterspec:
+        prefix, *rest = spec.split(FILTER_PATH_SEPARATOR, 1)
+        filters.setdefault(prefix, []).extend(rest)
+    return filters
+
+
+def normalize_filterspec(filterspec) -> tuple[str, ...]:
+    return tuple(sorted(set(filterspec)))
 
 
 def path_to_camelcase(path):
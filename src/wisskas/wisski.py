@@ -1,58 +1,117 @@
+import io
 import logging
 import pathlib
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import TYPE_CHECKING
 
-from lxml import etree, objectify
-
+from wisskas import cache
 from wisskas.string_utils import id_to_classname
 
-WISSKI_TYPES = {
+if TYPE_CHECKING:
+    from lxml import etree
+
+
+class FieldType(StrEnum):
     # TODO add support for all Wisski field types: https://wiss-ki.eu/documentation/pathbuilder/configuration/lists
-    "string": "str",
-    "list_string": "list[str]",  # FIXME this doesn't get annotated properly, need to change the Type's cardinality instead
-    "uri": "AnyUrl",
+    STRING = "string"
+    LIST_STRING = "list_string"
+    URI = "uri"
+    ENTITY_REFERENCE = "entity_reference"
+
+
+WISSKI_TYPES = {
+    FieldType.STRING: "str",
+    FieldType.LIST_STRING: "list[str]",  # FIXME this doesn't get annotated properly, need to change the Type's cardinality instead
+    FieldType.URI: "AnyUrl",
 }
 
 
+@dataclass(slots=True, eq=False)
 class WissKIPath:
-    def __init__(self, path_element: etree._Element):
+    """A (compact) WissKI path. All attributes are converted to plain Python values at load time.
+    Clones created by wisskas.filter share this type and additionally set the binding attributes."""
+
+    id: str
+    path_array: list[str | None]
+    cardinality: int = 1
+    group_id: str | None = None
+    datatype_property: str | None = None
+    fieldtype: FieldType | None = None
+    name: str | None = None
+
+    # computed/derived fields
+    rdf_class: str | None = None
+    class_name: str | None = None
+    type: str | None = None
+    # after nesting: the root path this path refers to (False if it isn't a reference)
+    entity_reference: "WissKIPath | bool" = field(default=False, repr=False)
+    fields: dict[str, "WissKIPath"] = field(default_factory=dict, repr=False)
+    parents: dict[str, "WissKIPath"] = field(default_factory=dict, repr=False)
+
+    # raw data from WissKI XML, only kept on request (e.g. for displaying it)
+    xml: str | None = field(default=None, repr=False)
+
+    # set on clones
+    binding_vars: list[str] = field(default_factory=list)
+    binding: str | None = None
+    root: bool = False
+
+    @classmethod
+    def from_element(
+        cls, path_element: "etree._Element", keep_xml: bool = False
+    ) -> "WissKIPath":
         if path_element.tag != "path":
             # TODO @lupl needs to create a schema for WissKI paths and validate against it
             raise ValueError("WissKIPath expects a <path> element")
 
-        # raw data from WissKI XML -- these are all lxml 'ObjectifiedElement's
-        # child tags are unique so store in dict
-        self.xml = {child.tag: child for child in path_element.iterchildren()}
-
-        # computed/derived fields
-        self.cardinality = self.xml["cardinality"]
-        self.path_array = [el.text for el in path_element.path_array.iterchildren()]
-
-        self.id = self.xml["id"].text
-        self.fields = {}
-        self.parents = {}
-        # self.binding_vars = []
+        # copy the text of the (unique) child tags, the element can be freed afterwards
+        values = {
+            child.tag: child.text
+            for child in path_element.iterchildren()
+            if child.tag != "path_array"
+        }
+        path_array = [el.text for el in path_element.find("path_array")]
+        path_id = values["id"]
 
-        # TODO add to path instead?
-        self.datatype_property = (
-            self.xml["datatype_property"]
-            if self.xml["datatype_property"] != "empty"
-            else None
-        )
+        # root types (== paths without a parent group) have group_id 0
+        group_id = values["group_id"] if values["group_id"] != "0" else None
 
-        # set rdf class if this is a root type (== it has no parent group)
-        self.rdf_class = self.path_array[-1] if self.xml["group_id"] == 0 else None
-        self.group_id = self.xml["group_id"] if self.xml["group_id"] != 0 else None
+        datatype_property = values.get("datatype_property")
+        fieldtype = FieldType(values["fieldtype"]) if values.get("fieldtype") else None
 
-        # is_group is misleading, paths are groups if their fields isn't empty
-        self.class_name = id_to_classname(self.id) if self.xml["is_group"] else None
+        if keep_xml:
+            from lxml import etree
 
-        self.entity_reference = self.xml["fieldtype"] == "entity_reference"
+            etree.indent(path_element)
+            xml = etree.tostring(path_element, encoding="unicode", with_tail=False)
+        else:
+            xml = None
 
-        # set python field type
-        self.type = (
-            WISSKI_TYPES[self.xml["fieldtype"]]
-            if self.xml["fieldtype"] and not self.entity_reference
-            else None
+        return cls(
+            id=path_id,
+            path_array=path_array,
+            cardinality=int(values["cardinality"]),
+            group_id=group_id,
+            # TODO add to path instead?
+            datatype_property=datatype_property
+            if datatype_property not in (None, "empty")
+            else None,
+            fieldtype=fieldtype,
+            name=values.get("name"),
+            # set rdf class if this is a root type
+            rdf_class=path_array[-1] if group_id is None else None,
+            # is_group is misleading, paths are groups if their fields isn't empty
+            class_name=id_to_classname(path_id)
+            if values.get("is_group") == "1"
+            else None,
+            # set python field type
+            type=WISSKI_TYPES[fieldtype]
+            if fieldtype and fieldtype != FieldType.ENTITY_REFERENCE
+            else None,
+            entity_reference=fieldtype == FieldType.ENTITY_REFERENCE,
+            xml=xml,
         )
 
 
@@ -61,44 +120,233 @@ def root_type_dict(paths: list[WissKIPath]) -> dict[str, WissKIPath]:
     return {path.rdf_class: path for path in paths if path.rdf_class}
 
 
-def parse_pathbuilder_paths(xml: pathlib.Path | str) -> list[WissKIPath]:
-    """Parses a pathbuilder XML definition from a file or XML string. Returns as a flat dict of WissKIPaths"""
-    if isinstance(xml, pathlib.Path):
-        root_element = objectify.parse(xml).getroot()
-    else:
-        root_element = objectify.fromstring(xml)
+def parse_pathbuilder_paths(
+    xml: pathlib.Path | str | bytes, keep_xml: bool = False
+) -> list[WissKIPath]:
+    """Parses a pathbuilder XML definition from a file or XML string. Returns as a flat dict of WissKIPaths
+
+    The XML is parsed incrementally, every <path> element is freed as soon as its WissKIPath has been
+    created, so memory use doesn't grow with the size of the XML tree. Set keep_xml to retain the raw
+    XML of every path.
+    """
+    # lxml is only imported when there actually is XML to parse, i.e. not on cache hits
+    from lxml import etree
+
+    if not isinstance(xml, pathlib.Path):
+        xml = io.BytesIO(xml.encode() if isinstance(xml, str) else xml)
+
+    paths = []
+    for _event, path_element in etree.iterparse(xml, tag="path"):
+        if path_element.findtext("enabled") == "1":
+            paths.append(WissKIPath.from_element(path_element, keep_xml))
+        # free the element as well as all already processed siblings
+        path_element.clear()
+        while path_element.getprevious() is not None:
+            del path_element.getparent()[0]
+
+    return paths
+
+
+# the attributes of a parsed (not yet nested) path, which are all plain values
+PATH_RECORD = (
+    "id",
+    "path_array",
+    "cardinality",
+    "group_id",
+    "datatype_property",
+    "fieldtype",
+    "name",
+    "rdf_class",
+    "class_name",
+    "type",
+    "entity_reference",
+    "xml",
+)
 
+
+def path_records(paths: list[WissKIPath]) -> list[tuple]:
+    """Flattens parsed (or nested) paths into tuples of plain values, which can be pickled regardless of the
+    size of the pathbuilder (unlike the nested paths, which refer to each other)"""
     return [
-        WissKIPath(path_element)
-        for path_element in root_element.iterchildren()
-        if path_element.enabled
+        tuple(
+            # nesting resolves entity references to their target
+            bool(path.entity_reference)
+            if name == "entity_reference"
+            else getattr(path, name)
+            for name in PATH_RECORD
+        )
+        for path in paths
     ]
 
 
-def nest_paths(paths: list[WissKIPath]):
-    """Adds field, parent and entity_references to a flat list of paths"""
-    root_types = root_type_dict(paths)
-    path_dict = {path.id: path for path in paths}
+def paths_from_records(records: list[tuple]) -> list[WissKIPath]:
+    """Recreates the (not yet nested) paths from their records"""
+    paths = [WissKIPath(**dict(zip(PATH_RECORD, record))) for record in records]
+    for path in paths:
+        if path.fieldtype is not None:
+            path.fieldtype = FieldType(path.fieldtype)
+    return paths
+
+
+def reference_closures(references: dict[str, set[str]]) -> dict[str, frozenset[str]]:
+    """Returns the ids of all root types that can (transitively) be reached from every root type, given the
+    root types that each of them refers to directly. The strongly connected components of the reference
+    graph are found with Tarjan's algorithm, and all root types of a component share the same closure."""
+    closures = {}
+    order = {}
+    lowlink = {}
+    stack = []
+    for start in references:
+        if start in order:
+            continue
+        order[start] = lowlink[start] = len(order)
+        stack.append(start)
+        work = [(start, iter(references[start]))]
+        while work:
+            node, targets = work[-1]
+            for target in targets:
+                if target not in order:
+                    order[target] = lowlink[target] = len(order)
+                    stack.append(target)
+                    work.append((target, iter(references.get(target, ()))))
+                    break
+                if target not in closures:
+                    # still on the stack, i.e. part of the current component
+                    lowlink[node] = min(lowlink[node], order[target])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == order[node]:
+                    component = [stack.pop()]
+                    while component[-1] != node:
+                        component.append(stack.pop())
+                    reachable = set()
+                    for member in component:
+                        for target in references.get(member, ()):
+                            reachable.add(target)
+                            reachable.update(closures.get(target, ()))
+                    closure = frozenset(reachable)
+                    for member in component:
+                        closures[member] = closure
+    return closures
+
+
+class PathIndex(Mapping):
+    """The paths of a pathbuilder by id, along with the lookups that would otherwise require scanning all
+    paths. Everything is computed once from the flat paths, so it doesn't depend on them being nested."""
+
+    def __init__(self, paths: list[WissKIPath]):
+        self.paths = {path.id: path for path in paths}
+        self.root_types = root_type_dict(paths)
+        # the fields of every group by their id, in pathbuilder order
+        self.groups: dict[str, dict[str, WissKIPath]] = {}
+        # the root type that every (resolvable) entity reference refers to, by id of the reference
+        self.targets: dict[str, WissKIPath] = {}
+        # the entity references to every root type, by id of the root type
+        self.references: dict[str, dict[str, WissKIPath]] = {}
+        for path in paths:
+            if path.group_id:
+                self.groups.setdefault(path.group_id, {})[path.id] = path
+            if path.fieldtype == FieldType.ENTITY_REFERENCE:
+                target = self.root_types.get(path.path_array[-1])
+                if target is not None:
+                    self.targets[path.id] = target
+                    self.references.setdefault(target.id, {})[path.id] = path
+
+        # the groups above every path, from its root type down to its own group
+        self.ancestors: dict[str, tuple[WissKIPath, ...]] = {}
+        for path in paths:
+            self._add_ancestors(path)
+
+        # the ids of all root types that can be reached from every root type via entity references
+        direct = {root.id: set() for root in self.root_types.values()}
+        for path_id, target in self.targets.items():
+            direct.setdefault(self.root_of(path_id).id, set()).add(target.id)
+        self.closures: dict[str, frozenset[str]] = reference_closures(direct)
+
+    def _add_ancestors(self, path: WissKIPath) -> tuple[WissKIPath, ...]:
+        if path.id not in self.ancestors:
+            group = self.paths.get(path.group_id) if path.group_id else None
+            self.ancestors[path.id] = (
+                (*self._add_ancestors(group), group) if group else ()
+            )
+        return self.ancestors[path.id]
+
+    def __getitem__(self, path_id: str) -> WissKIPath:
+        return self.paths[path_id]
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def fields(self, group_id: str) -> dict[str, WissKIPath]:
+        """The fields of a group by their id (empty for paths that aren't groups)"""
+        return self.groups.get(group_id, {})
+
+    def root_of(self, path_id: str) -> WissKIPath:
+        """The root type that the path belongs to"""
+        ancestors = self.ancestors[path_id]
+        return ancestors[0] if ancestors else self.paths[path_id]
+
+    def closure(self, path_id: str) -> frozenset[str]:
+        """The ids of all root types that can be reached from the path and its fields via entity references"""
+        if path_id in self.closures:
+            return self.closures[path_id]
+        reachable = set()
+        stack = [path_id]
+        while stack:
+            path_id = stack.pop()
+            if target := self.targets.get(path_id):
+                reachable.add(target.id)
+                reachable.update(self.closures.get(target.id, ()))
+            stack.extend(self.fields(path_id))
+        return frozenset(reachable)
+
+
+def nest_paths(paths: list[WissKIPath]) -> tuple[dict[str, WissKIPath], PathIndex]:
+    """Adds field, parent and entity_references to a flat list of paths. Returns the root types by RDF class
+    and a PathIndex of all paths"""
+    index = PathIndex(paths)
 
     # create nested structure
     for path in paths:
         if path.group_id:
-            path_dict[path.group_id].fields[path.id] = path
+            index[path.group_id].fields[path.id] = path
             if path.entity_reference:
                 # look up based on CRM type
-                try:
-                    path.entity_reference = root_types[path.path_array[-1]]
-                    path.entity_reference.parents[path.id] = path
-                    # path["fields"] = path["reference"]["fields"]
-                    # path["is_group"] = 1
-                except KeyError as e:
+                target = index.targets.get(path.id)
+                if target is not None:
+                    path.entity_reference = target
+                    target.parents[path.id] = path
+                else:
                     logging.warning(
-                        f"path {path.id} is an entity_reference, but no known path for target CRM class {e}"
+                        f"path {path.id} is an entity_reference, but no known path for target CRM class '{path.path_array[-1]}'"
                     )
                     path.entity_reference = False
+                    # can still be represented by the target's uri
+                    path.type = WISSKI_TYPES[FieldType.URI]
 
-    return (root_types, path_dict)
+    return (index.root_types, index)
 
 
-def parse_paths(file):
-    return nest_paths(parse_pathbuilder_paths(file))
+def parse_paths(file: pathlib.Path | str, cache_dir: pathlib.Path | None = None):
+    """Parses and nests the paths of a pathbuilder definition. If a cache_dir is given, the records of the
+    parsed paths are stored there keyed by the XML content hash, and subsequent calls with the same content
+    skip XML parsing (the paths are nested again, which is much faster)
+    """
+    if cache_dir is None:
+        return nest_paths(parse_pathbuilder_paths(file))
+
+    content = file.read_bytes() if isinstance(file, pathlib.Path) else file.encode()
+    key = cache.cache_key(content)
+    records = cache.load(cache_dir, key)
+    if records is None:
+        paths = parse_pathbuilder_paths(content)
+        cache.store(cache_dir, key, path_records(paths))
+    else:
+        paths = paths_from_records(records)
+    return nest_paths(paths)
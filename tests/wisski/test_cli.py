@@ -1,11 +1,22 @@
+import importlib
+import json
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
 from wisskas.cli.main import main
+from wisskas.client import SPARQLClient
+from wisskas.serialize import openapi_document
 
 
 input_args = ["-input", "tests/data/releven_assertions_20240821.xml"]
 
 
 def run_cli(*args):
-    main([*input_args, *args])
+    # don't fill the user's cache
+    main([*input_args, "--no-cache", *args])
 
 
 def test_cli_endpoints():
@@ -14,6 +25,87 @@ def test_cli_endpoints():
     run_cli(
         "endpoints", "--endpoint-exclude-fields", "external_authority", "--git-endpoint"
     )
+    # recursive model
+    run_cli("endpoints", "--max-depth", "1", "--endpoint-exclude-fields", "person")
+    run_cli(
+        "endpoints", "--max-depth", "none", "--endpoint-exclude-fields", "publication"
+    )
+    run_cli(
+        "endpoints", "--no-optimize", "--endpoint-exclude-fields", "external_authority"
+    )
+
+
+def test_cli_spec_file(tmp_path):
+    """crash tests"""
+    spec_file = tmp_path / "endpoints.toml"
+    spec_file.write_text(
+        '[[endpoints]]\npath_id = "external_authority"\nmax_depth = 0\n'
+    )
+    run_cli("endpoints", "--spec", str(spec_file))
+    run_cli(
+        "endpoints", "--spec", str(spec_file), "-ee", "external_authority/authority"
+    )
+
+
+def test_cli_lazy_app(tmp_path):
+    output_prefix = str(tmp_path / "app")
+    run_cli(
+        "endpoints",
+        "-ee",
+        "external_authority/authority",
+        "--lazy",
+        "-o",
+        output_prefix,
+        "-a",
+        "http://localhost",
+    )
+    assert "LazyRoute(" in (tmp_path / "app.py").read_text()
+    openapi = json.loads((tmp_path / "app.openapi.json").read_text())
+    assert "/authority" in openapi["paths"]
+    with pytest.raises(RuntimeError, match="ZeroDivisionError"):
+        openapi_document("1 / 0", tmp_path / "broken.py")
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_cli_detail_app(tmp_path, monkeypatch, mode):
+    run_cli(
+        "endpoints",
+        "-ee",
+        "external_authority/authority/details",
+        "--field-projection",
+        *(["--async"] if mode == "async" else []),
+        "-o",
+        str(tmp_path / f"{mode}_app"),
+        "-a",
+        "http://localhost",
+    )
+    queries = []
+    results = {"head": {"vars": []}, "results": {"bindings": []}}
+
+    def query(self, sparql):
+        queries.append(sparql)
+        return results
+
+    async def aquery(self, sparql):
+        return query(self, sparql)
+
+    monkeypatch.setattr(SPARQLClient, "query", query)
+    monkeypatch.setattr(SPARQLClient, "aquery", aquery)
+    monkeypatch.syspath_prepend(tmp_path)
+    app = importlib.import_module(f"{mode}_app").app
+    params = {"unique_identifier": "https://example.org/1"}
+    with TestClient(app) as client:
+        response = client.get("/authority/details", params=params)
+        # unknown fields are rejected without querying
+        for fields in ["", "nonexistent"]:
+            rejected = client.get(
+                "/authority/details", params={**params, "fields": fields}
+            )
+            assert rejected.status_code == 422
+    assert response.status_code == 404
+    # detail requests don't count their matches
+    assert len(queries) == 1
+    assert "?cnt" not in queries[0]
 
 
 def test_cli_paths():
@@ -22,3 +114,26 @@ def test_cli_paths():
     run_cli("paths", "--flat", "--all")
     run_cli("paths", "--nested")
     run_cli("paths", "--nested", "--all")
+
+
+def test_cli_cache_options(tmp_path):
+    """crash tests"""
+    main([*input_args, "--no-cache", "paths", "--nested"])
+    main([*input_args, "--cache-dir", str(tmp_path), "paths", "--nested"])
+    main([*input_args, "--cache-dir", str(tmp_path), "paths", "--nested"])
+
+
+def test_cli_lazy_imports():
+    """parsing arguments doesn't require jinja or lxml"""
+    modules = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, wisskas.cli.main; print(' '.join(sys.modules))",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    assert "jinja2" not in modules
+    assert "lxml" not in modules
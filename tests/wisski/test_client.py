@@ -0,0 +1,195 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+from pydantic import BaseModel
+from rdflib import Graph, Literal, URIRef
+from rdfproxy import QueryParameters, SPARQLModelAdapter, SPARQLWrapper
+
+from wisskas.client import SPARQLClient
+
+
+class Thing(BaseModel):
+    id: str
+    name: str
+
+
+def test_sparql_client():
+    graph = Graph()
+    for i in range(3):
+        graph.add(
+            (
+                URIRef(f"https://example.org/{i}"),
+                URIRef("urn:name"),
+                Literal(f"thing {i}"),
+            )
+        )
+    requests = []
+
+    def endpoint(request):
+        requests.append(request)
+        query = parse_qs(request.content.decode())["query"][0]
+        return httpx.Response(200, content=graph.query(query).serialize(format="json"))
+
+    client = SPARQLClient(
+        "https://sparql.example.org/",
+        pool_size=2,
+        transport=httpx.MockTransport(endpoint),
+    )
+    query = "SELECT ?id ?name WHERE { ?id <urn:name> ?name . }"
+    adapter = client.adapter(query, Thing)
+    assert client.adapter(query, Thing) is adapter
+    page = adapter.query(QueryParameters(size=2))
+    assert page.total == 3
+    assert {item.name for item in page.items} <= {f"thing {i}" for i in range(3)}
+    # the count and the items query both went through the pool
+    assert len(requests) == 2
+    client.close()
+
+
+def test_rdfproxy_internals():
+    # the client relies on these private parts of rdfproxy, which is why its exact version is pinned
+    from rdfproxy.constructor import _PageQueryConstructor
+    from rdfproxy.mapper import _ModelBindingsMapper
+
+    assert callable(SPARQLWrapper._get_bindings_from_json_response)
+    assert callable(_PageQueryConstructor.get_items_query)
+    assert callable(_PageQueryConstructor.get_count_query)
+    assert callable(_ModelBindingsMapper.get_models)
+    queries = []
+
+    class Wrapper:
+        def queries(self, *query):
+            queries.append(query)
+            return [
+                iter([{"id": "https://example.org/1", "name": "thing"}]),
+                iter([{"cnt": 1}]),
+            ]
+
+    adapter = SPARQLModelAdapter(
+        target="https://sparql.example.org/",
+        query="SELECT ?id ?name WHERE { ?id <urn:name> ?name . }",
+        model=Thing,
+    )
+    assert isinstance(adapter.sparqlwrapper, SPARQLWrapper)
+    assert adapter._model is Thing and "?name" in adapter._query
+    adapter.sparqlwrapper = Wrapper()
+    page = adapter.get_page(QueryParameters())
+    # all queries of a page are sent with a single call of the (replaced) wrapper
+    assert len(queries) == 1 and len(queries[0]) == 2
+    assert page.total == 1
+    assert page.items == [Thing(id="https://example.org/1", name="thing")]
+
+
+def test_sparql_client_async():
+    graph = Graph()
+    graph.add((URIRef("https://example.org/1"), URIRef("urn:name"), Literal("thing")))
+
+    loops = []
+
+    async def endpoint(request):
+        loops.append(asyncio.get_running_loop())
+        query = parse_qs(request.content.decode())["query"][0]
+        return httpx.Response(200, content=graph.query(query).serialize(format="json"))
+
+    def blocking_endpoint(request):
+        raise AssertionError("aget_page() sent a query from a worker thread")
+
+    client = SPARQLClient(
+        "https://sparql.example.org/",
+        max_concurrency=1,
+        transport=httpx.MockTransport(blocking_endpoint),
+        async_transport=httpx.MockTransport(endpoint),
+    )
+    adapter = client.adapter("SELECT ?id ?name WHERE { ?id <urn:name> ?name . }", Thing)
+
+    async def query():
+        page = await client.aget_page(adapter, QueryParameters())
+        await client.aclose()
+        return page, asyncio.get_running_loop()
+
+    page, loop = asyncio.run(query())
+    assert page.total == 1
+    assert page.items == [Thing(id="https://example.org/1", name="thing")]
+    # both queries of the page were sent from the event loop of the caller
+    assert loops == [loop, loop]
+
+
+def test_sparql_client_async_threads():
+    graph = Graph()
+    graph.add((URIRef("https://example.org/1"), URIRef("urn:name"), Literal("thing")))
+    requests = []
+
+    async def endpoint(request):
+        # only answers once the queries of both pages are pending
+        requests.append(request)
+        while len(requests) < 4:
+            await asyncio.sleep(0.01)
+        query = parse_qs(request.content.decode())["query"][0]
+        return httpx.Response(200, content=graph.query(query).serialize(format="json"))
+
+    client = SPARQLClient(
+        "https://sparql.example.org/", async_transport=httpx.MockTransport(endpoint)
+    )
+    adapter = client.adapter("SELECT ?id ?name WHERE { ?id <urn:name> ?name . }", Thing)
+
+    async def query():
+        # waiting for the SPARQL endpoint mustn't hold a thread
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(1))
+        pages = await asyncio.wait_for(
+            asyncio.gather(
+                client.aget_page(adapter, QueryParameters()),
+                client.aget_page(adapter, QueryParameters()),
+            ),
+            timeout=5,
+        )
+        await client.aclose()
+        return pages
+
+    assert [page.total for page in asyncio.run(query())] == [1, 1]
+
+
+def test_sparql_client_replicas(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("time.monotonic", lambda: now[0])
+    graph = Graph()
+    graph.add((URIRef("https://example.org/1"), URIRef("urn:name"), Literal("thing")))
+    down = {"a.example.org"}
+    requests = []
+
+    def endpoint(request):
+        requests.append(request.url.host)
+        if request.url.host in down:
+            raise httpx.ConnectError("down", request=request)
+        query = parse_qs(request.content.decode())["query"][0]
+        return httpx.Response(200, content=graph.query(query).serialize(format="json"))
+
+    client = SPARQLClient(
+        ["https://a.example.org/", "https://b.example.org/"],
+        failure_threshold=2,
+        failure_cooldown=10,
+        transport=httpx.MockTransport(endpoint),
+    )
+    query = "SELECT ?id WHERE { ?id <urn:name> ?name . }"
+    # failed queries are retried on the other replica, until the failed one isn't used anymore
+    for _ in range(4):
+        assert client.query(query)["results"]["bindings"]
+    assert requests.count("a.example.org") == 2
+    assert requests[-2:] == ["b.example.org", "b.example.org"]
+
+    # the circuit of the failed replica is closed again after the cooldown
+    down.clear()
+    now[0] = 11
+    requests.clear()
+    client.query(query)
+    client.query(query)
+    assert sorted(requests) == ["a.example.org", "b.example.org"]
+    a, b = client.backends.backends
+    assert (a.failures, a.outstanding, b.outstanding) == (0, 0, 0)
+
+    down.update({"a.example.org", "b.example.org"})
+    with pytest.raises(httpx.ConnectError):
+        client.query(query)
+    client.close()
@@ -0,0 +1,80 @@
+import pathlib
+
+from wisskas.filter import (
+    DEFAULT_MAX_DEPTH,
+    endpoint_exclude_fields,
+    endpoint_include_fields,
+    find_cycle,
+)
+from wisskas.string_utils import parse_filterspec
+from wisskas.wisski import parse_paths
+
+test_data_file = pathlib.Path("tests/data/releven_assertions_20240821.xml")
+
+
+def test_parse_filterspec():
+    assert parse_filterspec(["a", "b.c", "b.d.e", "b"]) == {"a": [], "b": ["c", "d.e"]}
+
+
+def test_memoized_clones():
+    _root_types, paths = parse_paths(test_data_file)
+    memo = {}
+    include = ["external_authority_url", "external_authority_display_name"]
+    first = endpoint_include_fields(paths["external_authority"], include, "Ea", memo)
+    second = endpoint_include_fields(
+        paths["external_authority"], list(reversed(include)), "Ea", memo
+    )
+    assert first is second
+    assert list(first.fields) == [
+        "external_authority_display_name",
+        "external_authority_url",
+    ]
+    # a different filterspec doesn't hit the memo
+    excluded = endpoint_exclude_fields(paths["external_authority"], [], "Ea", memo)
+    assert excluded is not first
+
+
+def test_find_cycle():
+    assert find_cycle(("a",)) == 0
+    assert find_cycle(("a", "b", "c")) == 0
+    assert find_cycle(("a", "a")) == 1
+    assert find_cycle(("c", "a", "b", "a")) == 2
+
+
+def test_bounded_expansion(caplog):
+    _root_types, paths = parse_paths(test_data_file)
+
+    def max_references(clone):
+        return max(
+            (
+                max_references(field) + bool(field.entity_reference)
+                for field in clone.fields.values()
+            ),
+            default=0,
+        )
+
+    for max_depth in range(3):
+        person = endpoint_exclude_fields(paths["person"], [], "Person", {}, max_depth)
+        assert max_references(person) <= max_depth + 1
+        # recursive references to person are cut off right away
+        appellation = person.fields["person_appellation_assertion"]
+        assert appellation.fields["person_appellation_by"].type == "AnyUrl"
+        assert appellation.fields["person_appellation_by"].fields == {}
+
+    person = endpoint_exclude_fields(paths["person"], [], "Person", {})
+    assert max_references(person) <= DEFAULT_MAX_DEPTH + 1
+
+    # without a maximum depth, references are expanded until they'd close a cycle
+    def expanded_chains(clone, chain):
+        if clone.entity_reference and clone.fields:
+            chain = (*chain, clone.entity_reference.id)
+            yield chain
+        for field in clone.fields.values():
+            yield from expanded_chains(field, chain)
+
+    with caplog.at_level("INFO"):
+        person = endpoint_exclude_fields(paths["person"], [], "Person", {}, None)
+    chains = list(expanded_chains(person, ("person",)))
+    assert max(map(len, chains)) > 3
+    assert all(len(set(chain)) == len(chain) for chain in chains)
+    assert "not expanding entity reference person_appellation_by" in caplog.text
@@ -0,0 +1,237 @@
+import importlib
+import pathlib
+
+import pytest
+from rdflib import RDF, Graph, Literal, URIRef
+from rdfproxy import QueryParameters, SPARQLModelAdapter
+
+from wisskas.generate import (
+    EndpointSpec,
+    GenerationOptions,
+    affected_specs,
+    generate_endpoints,
+    load_endpoint_specs,
+)
+from wisskas.manifest import Manifest, changed_paths
+from wisskas.runtime import bind_values, merge_branch
+from wisskas.serialize import serialize_shared_models
+from wisskas.wisski import parse_paths
+
+test_data_file = pathlib.Path("tests/data/releven_assertions_20240821.xml")
+
+
+def test_generate_endpoints_parallel():
+    _root_types, paths = parse_paths(test_data_file)
+    specs = [
+        EndpointSpec("/external_authority", "external_authority", ()),
+        EndpointSpec(
+            "/external_authority/details",
+            "external_authority",
+            ("external_authority_url",),
+            include=True,
+        ),
+        EndpointSpec("/person", "person", ()),
+    ]
+    options = GenerationOptions({"crm": "http://www.cidoc-crm.org/cidoc-crm/"})
+    sequential = generate_endpoints(paths, specs, options)
+    assert [endpoint.path for endpoint in sequential] == [spec.path for spec in specs]
+    assert sequential[1].details
+    assert generate_endpoints(paths, specs, options, jobs=2) == sequential
+
+
+def test_generate_endpoints_spawned(monkeypatch):
+    # workers that aren't forked get the records of the paths, and only return plain data
+    monkeypatch.setattr("multiprocessing.get_all_start_methods", lambda: ["spawn"])
+    _root_types, paths = parse_paths(test_data_file)
+    specs = [
+        EndpointSpec("/person", "person", ()),
+        EndpointSpec("/person_genderless", "person", ("person_gender_assertion",)),
+    ]
+    options = GenerationOptions({}, max_depth=1, shared_models=True)
+    sequential = generate_endpoints(paths, specs, options)
+    spawned = generate_endpoints(paths, specs, options, jobs=2)
+    assert spawned == sequential
+    assert serialize_shared_models(spawned, "shared") == serialize_shared_models(
+        sequential, "shared"
+    )
+
+
+def test_generate_endpoints_incremental(tmp_path):
+    _root_types, paths = parse_paths(test_data_file)
+    specs = [
+        EndpointSpec("/external_authority", "external_authority", ()),
+        EndpointSpec("/person", "person", ()),
+    ]
+    options = GenerationOptions({}, str(tmp_path / "api"), max_depth=0)
+    manifest = Manifest(tmp_path / "api.manifest.json")
+
+    def generate():
+        endpoints = generate_endpoints(paths, specs, options, manifest=manifest)
+        for endpoint in endpoints:
+            if endpoint.model is not None:
+                for content, ext in ((endpoint.model, "py"), (endpoint.query, "rq")):
+                    (tmp_path / f"{endpoint.filename}.{ext}").write_text(content)
+        manifest.save()
+        return endpoints
+
+    assert all(endpoint.model for endpoint in generate())
+    manifest = Manifest.load(tmp_path / "api.manifest.json")
+    unchanged = generate()
+    assert all(endpoint.model is None for endpoint in unchanged)
+    assert unchanged[1].class_name == "Person"
+
+    (tmp_path / "api_person.rq").unlink()
+    assert [endpoint.model is None for endpoint in generate()] == [True, False]
+
+
+def test_affected_specs():
+    _root_types, old = parse_paths(test_data_file)
+    _root_types, new = parse_paths(test_data_file)
+    assert changed_paths(old, new) == set()
+    new["external_authority_url"].datatype_property = "http://example.org/url"
+    del new.paths["gender"]
+    changed = changed_paths(old, new)
+    assert changed == {"external_authority_url", "gender"}
+
+    specs = [
+        EndpointSpec("/external_authority", "external_authority", ()),
+        EndpointSpec("/person", "person", ()),
+        EndpointSpec("/appellation", "person_appellation_assertion", ()),
+        EndpointSpec("/language", "language", ()),
+        EndpointSpec("/gender", "gender", ()),
+    ]
+    assert [spec.path for spec in affected_specs(specs, changed, old, new)] == [
+        "/external_authority",
+        "/person",
+        "/appellation",
+        "/gender",
+    ]
+
+
+def test_load_endpoint_specs(tmp_path):
+    spec_file = tmp_path / "endpoints.toml"
+    spec_file.write_text(
+        """
+max_depth = 1
+[prefixes]
+crm = "http://www.cidoc-crm.org/cidoc-crm/"
+
+[[endpoints]]
+path_id = "external_authority"
+
+[[endpoints]]
+path_id = "person"
+route = "person/details"
+include = ["person_appellation_assertion"]
+split_queries = true
+"""
+    )
+    options = GenerationOptions({}, max_depth=1)
+    authority, person = load_endpoint_specs(spec_file, options)
+    assert authority.path == "/external_authority"
+    assert authority.options.prefixes == {"crm": "http://www.cidoc-crm.org/cidoc-crm/"}
+    assert (person.path, person.include, person.filters) == (
+        "/person/details",
+        True,
+        ("person_appellation_assertion",),
+    )
+    assert person.options.split_queries and person.options.max_depth == 1
+
+    _root_types, paths = parse_paths(test_data_file)
+    authority_endpoint, person_endpoint = generate_endpoints(
+        paths, [authority, person], options
+    )
+    assert "PREFIX crm:" in authority_endpoint.query
+    assert not authority_endpoint.branches and person_endpoint.branches
+
+    spec_file.write_text('[[endpoints]]\npath_id = "person"\nsplit_queries = 1\n')
+    with pytest.raises(ValueError, match="split_queries"):
+        load_endpoint_specs(spec_file, options)
+
+
+def test_shared_models(tmp_path, monkeypatch):
+    _root_types, paths = parse_paths(test_data_file)
+    specs = [
+        EndpointSpec("/person", "person", ()),
+        EndpointSpec("/person/details", "person", ()),
+        EndpointSpec("/person_genderless", "person", ("person_gender_assertion",)),
+    ]
+    options = GenerationOptions({}, max_depth=0, shared_models=True)
+    endpoints = generate_endpoints(paths, specs, options)
+    # the list and details endpoints share their root clone, but not their settings
+    assert [(endpoint.filename, endpoint.details) for endpoint in endpoints[:2]] == [
+        ("_person", False),
+        ("_person_details", True),
+    ]
+    shared = serialize_shared_models(endpoints, "shared")
+    (tmp_path / "shared.py").write_text(shared)
+    for endpoint in endpoints:
+        (tmp_path / f"{endpoint.filename}.py").write_text(endpoint.model)
+    monkeypatch.syspath_prepend(tmp_path)
+    person, details, genderless = (
+        getattr(importlib.import_module(endpoint.filename), endpoint.class_name)
+        for endpoint in endpoints
+    )
+    # identical models share their classes, distinct ones with the same name are numbered
+    assert details is person and person.__name__ == "Person"
+    assert genderless.__name__ == "Person_2"
+    # nested classes are shared between the models too
+    assert (
+        genderless.model_fields["person_appellation_assertion"].annotation
+        == person.model_fields["person_appellation_assertion"].annotation
+    )
+
+
+def test_generate_split_queries(tmp_path, monkeypatch):
+    _root_types, paths = parse_paths(test_data_file)
+    spec = EndpointSpec("/person", "person", ())
+    options = GenerationOptions({}, max_depth=0, split_queries=True)
+    (endpoint,) = generate_endpoints(paths, [spec], options)
+    assert endpoint.branches
+    assert ("person_descriptive_name",) in [branch.path for branch in endpoint.branches]
+
+    manifest = Manifest(tmp_path / "split.manifest.json")
+    manifest.update(endpoint, "hash")
+    manifest.save()
+    entry = Manifest.load(manifest.filename).unchanged("/person", "hash")
+    assert entry.branches == endpoint.branches
+
+    (tmp_path / "split_person.py").write_text(endpoint.model)
+    monkeypatch.syspath_prepend(tmp_path)
+    models = importlib.import_module("split_person")
+
+    person = URIRef("https://example.org/person/1")
+    graph = Graph()
+    graph.add(
+        (person, RDF.type, URIRef("http://www.cidoc-crm.org/cidoc-crm/E21_Person"))
+    )
+    for note in ("a", "b"):
+        graph.add(
+            (
+                person,
+                URIRef("http://www.cidoc-crm.org/cidoc-crm/P3_has_note"),
+                Literal(note),
+            )
+        )
+
+    page = SPARQLModelAdapter(
+        target=graph,
+        query=endpoint.query,
+        model=getattr(models, endpoint.base_class_name),
+    ).query(QueryParameters())
+    ids = [item.id for item in page.items]
+    items = [item.model_dump() for item in page.items]
+    for branch in endpoint.branches:
+        result = SPARQLModelAdapter(
+            target=graph,
+            query=bind_values(
+                endpoint.branch_queries[branch.name], endpoint.binding, ids
+            ),
+            model=getattr(models, branch.class_name),
+        ).query(QueryParameters(size=len(ids)))
+        merge_branch(items, branch.path, [item.model_dump() for item in result.items])
+
+    (item,) = items
+    assert sorted(item["person_descriptive_name"]) == ["a", "b"]
+    assert item["person_gender_assertion"] == []
+    getattr(models, endpoint.class_name).model_validate(item)
@@ -0,0 +1,30 @@
+from wisskas.metrics import Metrics, current_timings, phase
+
+
+def test_metrics():
+    metrics = Metrics(buckets=(0.1, 1))
+    metrics.gauge("queue", "waiting", lambda: {(("backend", 'a"b'),): 2})
+    with metrics.request("/person") as (timings, status):
+        assert current_timings.get() is timings
+        with phase("sparql"):
+            pass
+        timings.add("models", 0.5)
+        timings.add_rows(3)
+        status["code"] = 200
+    assert current_timings.get() is None
+    assert timings.server_timing().startswith(
+        "sparql;dur=0.0, models;dur=500.0, total;"
+    )
+
+    rendered = metrics.render()
+    assert 'wisskas_requests_total{endpoint="/person",code="200"} 1' in rendered
+    assert 'wisskas_result_rows_total{endpoint="/person"} 3' in rendered
+    assert (
+        'wisskas_request_phase_seconds_bucket{endpoint="/person",phase="models",le="0.1"} 0'
+        in rendered
+    )
+    assert (
+        'wisskas_request_phase_seconds_bucket{endpoint="/person",phase="models",le="1"} 1'
+        in rendered
+    )
+    assert 'queue{backend="a\\"b"} 2' in rendered
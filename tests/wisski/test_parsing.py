@@ -1,5 +1,11 @@
 import pathlib
-from wisskas.wisski import nest_paths, parse_pathbuilder_paths
+from wisskas.wisski import (
+    FieldType,
+    PathIndex,
+    nest_paths,
+    parse_pathbuilder_paths,
+    parse_paths,
+)
 
 test_data_file = pathlib.Path("tests/data/releven_assertions_20240821.xml")
 
@@ -11,5 +17,71 @@ def test_parse_pathbuilder_paths():
     parse_pathbuilder_paths(test_data_file)
 
 
+def test_parse_pathbuilder_paths_keep_xml():
+    paths = parse_pathbuilder_paths(test_data_file.read_text())
+    assert all(path.xml is None for path in paths)
+    paths = parse_pathbuilder_paths(test_data_file.read_bytes(), keep_xml=True)
+    assert paths[0].xml.startswith("<path>")
+
+
+def test_path_attributes():
+    paths = {path.id: path for path in parse_pathbuilder_paths(test_data_file)}
+    assert not hasattr(paths["person"], "__dict__")
+    assert paths["person"].cardinality == -1
+    assert paths["person"].group_id is None
+    assert paths["person"].rdf_class == "http://www.cidoc-crm.org/cidoc-crm/E21_Person"
+    assert paths["external_authority_url"].group_id == "external_authority"
+    assert paths["external_authority_url"].fieldtype is FieldType.URI
+    assert paths["external_authority_url"].type == "AnyUrl"
+
+
 def test_nest_paths():
     nest_paths(parse_pathbuilder_paths(test_data_file))
+
+
+def test_parse_paths_cache(tmp_path):
+    root_types, paths = parse_paths(test_data_file, tmp_path)
+    assert len(list(tmp_path.glob("*.pickle"))) == 1
+    cached_root_types, cached_paths = parse_paths(test_data_file, tmp_path)
+    assert cached_root_types.keys() == root_types.keys()
+    assert cached_paths.keys() == paths.keys()
+    # nesting links survive the round trip
+    assert all(
+        cached_paths[path.group_id].fields[path.id] is path
+        for path in cached_paths.values()
+        if path.group_id
+    )
+
+
+def test_parse_paths_uncacheable(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RecursionError("maximum recursion depth exceeded while pickling")
+
+    monkeypatch.setattr("pickle.dump", fail)
+    _root_types, paths = parse_paths(test_data_file, tmp_path)
+    assert paths
+    assert not list(tmp_path.iterdir())
+
+
+def test_path_index():
+    root_types, paths = parse_paths(test_data_file)
+    assert isinstance(paths, PathIndex)
+    assert paths.root_types is root_types
+    assert (
+        root_types["http://www.cidoc-crm.org/cidoc-crm/E21_Person"] is paths["person"]
+    )
+    assert paths.fields("external_authority").keys() == {
+        "external_authority_url",
+        "external_authority_display_name",
+    }
+    assert paths.fields("external_authority_url") == {}
+    # entity references are indexed by the root type they refer to
+    assert paths.references
+    for target_id, references in paths.references.items():
+        for reference in references.values():
+            assert reference.entity_reference is paths[target_id]
+            assert target_id in paths.closure(paths.root_of(reference.id).id)
+    appellation = paths["person_appellation_assertion"]
+    assert [group.id for group in paths.ancestors[appellation.id]] == ["person"]
+    assert paths.root_of(appellation.id) is paths["person"]
+    assert paths.closure(appellation.id) <= paths.closure("person")
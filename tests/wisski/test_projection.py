@@ -0,0 +1,80 @@
+import importlib
+import json
+import pathlib
+
+import pytest
+from rdflib import RDF, Graph, Literal, URIRef
+from rdfproxy import QueryParameters, SPARQLModelAdapter
+
+from wisskas.generate import EndpointSpec, GenerationOptions, generate_endpoints
+from wisskas.projection import Projection, parse_fields, selects
+from wisskas.sparql import query_from_json
+from wisskas.string_utils import parse_filterspec
+from wisskas.wisski import parse_paths
+
+test_data_file = pathlib.Path("tests/data/releven_assertions_20240821.xml")
+
+
+def test_parse_fields():
+    assert parse_fields(" b.c, a,,b.c") == ("a", "b.c")
+    filters = parse_filterspec(parse_fields("a.b.c"))
+    assert selects(filters, ("a", "b"))
+    assert not selects(filters, ("a", "d"))
+    assert selects(parse_filterspec(["a.**"]), ("a", "d", "e"))
+
+
+def test_projection(tmp_path, monkeypatch):
+    _root_types, paths = parse_paths(test_data_file)
+    spec = EndpointSpec("/authority", "external_authority", ())
+    options = GenerationOptions({}, field_projection=True)
+    (endpoint,) = generate_endpoints(paths, [spec], options)
+    (tmp_path / "projected_authority.py").write_text(endpoint.model)
+    monkeypatch.syspath_prepend(tmp_path)
+    model = getattr(importlib.import_module("projected_authority"), endpoint.class_name)
+    projection = Projection(
+        query_from_json(json.loads(endpoint.representations[""])["query"]), model
+    )
+
+    graph = Graph()
+    corporate_body = URIRef("http://iflastandards.info/ns/lrm/lrmoo/F11_Corporate_Body")
+    for i, url in enumerate(["https://example.org/url", None]):
+        authority = URIRef(f"https://example.org/authority/{i}")
+        graph.add((authority, RDF.type, corporate_body))
+        graph.add(
+            (
+                authority,
+                URIRef("http://www.cidoc-crm.org/cidoc-crm/P1_is_identified_by"),
+                Literal(f"authority {i}"),
+            )
+        )
+        if url:
+            graph.add(
+                (
+                    authority,
+                    URIRef("http://www.w3.org/2004/02/skos/core#exactMatch"),
+                    URIRef(url),
+                )
+            )
+
+    assert projection(None) == (endpoint.query, model)
+    query, projected_model = projection("external_authority_display_name")
+    assert projection("external_authority_display_name ,") == (query, projected_model)
+    assert "?Authority_external_authority_url\n" not in query
+    for fields in ["", "nonexistent", "external_authority_display_name.name"]:
+        with pytest.raises(ValueError):
+            projection(fields)
+    assert list(projected_model.model_fields) == [
+        "id",
+        "external_authority_display_name",
+    ]
+
+    page = SPARQLModelAdapter(target=graph, query=query, model=projected_model).query(
+        QueryParameters()
+    )
+    # authorities without the (required) url are still excluded
+    assert [item.model_dump(mode="json") for item in page.items] == [
+        {
+            "id": "https://example.org/authority/0",
+            "external_authority_display_name": "authority 0",
+        }
+    ]
@@ -0,0 +1,60 @@
+import pathlib
+
+from rdfproxy import Page, QueryParameters
+
+from wisskas.generate import EndpointSpec, GenerationOptions, generate_endpoints
+from wisskas.response_cache import ResponseCache, cache_key, encode, etag_matches
+from wisskas.serialize import serialize_entrypoint
+from wisskas.wisski import parse_paths
+
+test_data_file = pathlib.Path("tests/data/releven_assertions_20240821.xml")
+
+
+def test_response_cache(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("time.monotonic", lambda: now[0])
+    cache = ResponseCache(maxsize=2, ttl=10)
+    assert cache_key("a", QueryParameters()) == cache_key("a", QueryParameters(page=1))
+    assert cache_key("a", QueryParameters()) != cache_key("b", QueryParameters())
+
+    first = cache.put("a", b"[1]")
+    cache.put("b", b"[2]")
+    assert cache.get("a") is first
+    # b is the least recently used entry
+    cache.put("c", b"[3]")
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.invalidate() == 1
+
+    assert first.response().body == b"[1]"
+    assert first.response(f'W/{first.etag}, "x"').status_code == 304
+    assert not etag_matches('"x"', first.etag)
+    assert encode(Page[int](items=[1], page=1, size=1, total=1, pages=1))
+
+
+def test_cached_entrypoint():
+    _root_types, paths = parse_paths(test_data_file)
+    specs = [
+        EndpointSpec("/authority", "external_authority", ()),
+        EndpointSpec("/authority/details", "external_authority", ()),
+    ]
+    endpoints = {
+        endpoint.path: endpoint
+        for endpoint in generate_endpoints(paths, specs, GenerationOptions({}))
+    }
+    entrypoint = serialize_entrypoint(
+        endpoints, "http://localhost", cache={"size": 10, "ttl": 60}
+    )
+    assert "ResponseCache(" in entrypoint
+    compile(entrypoint, "entrypoint.py", "exec")
+    entrypoint = serialize_entrypoint(
+        endpoints,
+        "http://localhost",
+        cache={"size": 10, "ttl": 60},
+        concurrency={"max": 4, "endpoint": 2, "coalesce": True},
+        metrics=True,
+    )
+    assert "async def" in entrypoint
+    compile(entrypoint, "entrypoint.py", "exec")
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from rdflib.plugins.sparql import prepareQuery
+
+from wisskas.runtime import (
+    Coalescer,
+    LazyRoute,
+    StartupTimings,
+    bind_values,
+    iri_ref,
+    limit,
+    merge_branch,
+    warm_up,
+)
+
+
+def test_bind_values():
+    query = "SELECT ?x ?y WHERE {\n  ?x <urn:p> ?y .\n}"
+    bound = bind_values(query, "x", ["https://example.org/1", "urn:a"])
+    assert "VALUES ?x { <https://example.org/1> <urn:a> }" in bound
+    prepareQuery(bound)
+    with pytest.raises(ValueError):
+        bind_values(query, "x", ["https://example.org/> } ?x ?y ?z {"])
+    with pytest.raises(ValueError):
+        iri_ref("")
+
+
+def test_merge_branch():
+    items = [{"id": "urn:1", "a": {"id": "urn:a"}}, {"id": "urn:2", "a": None}]
+    merge_branch(items, ("a", "values"), [{"id": "urn:1", "a": {"values": [1, 2]}}])
+    assert items == [
+        {"id": "urn:1", "a": {"id": "urn:a", "values": [1, 2]}},
+        {"id": "urn:2", "a": {"values": []}},
+    ]
+
+
+def test_coalescer():
+    calls = []
+
+    @limit(1)
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def requests():
+        coalescer = Coalescer()
+        return await asyncio.gather(
+            coalescer.run("a", lambda: fetch(1)),
+            coalescer.run("a", lambda: fetch(2)),
+            coalescer.run("b", lambda: fetch(3)),
+        )
+
+    assert asyncio.run(requests()) == [1, 1, 3]
+    assert calls == [1, 3]
+
+
+def test_lazy_route():
+    loads = []
+    routes = [LazyRoute(f"/{i}", lambda i=i: loads.append(i) or i) for i in range(3)]
+    assert routes[1].load() == 1
+    warm_up(routes).join()
+    assert loads == [1, 0, 2]
+    assert all(route.seconds is not None for route in routes)
+
+    timings = StartupTimings(0)
+    timings.phase("imports")
+    assert str(timings).startswith("imports ")
+    assert str(timings).endswith(f"total {timings.phases['imports'] * 1000:.0f}ms")
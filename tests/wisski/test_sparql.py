@@ -0,0 +1,123 @@
+import pathlib
+
+from rdflib import Graph
+from rdflib.plugins.sparql import prepareQuery
+
+from wisskas.filter import endpoint_exclude_fields
+from wisskas.optimize import optimize
+from wisskas.serialize import serialize_query
+from wisskas.sparql import (
+    IRI,
+    RDF_TYPE,
+    GroupPattern,
+    SelectQuery,
+    Serializer,
+    Triple,
+    Variable,
+    build_query,
+)
+from wisskas.wisski import parse_paths
+
+test_data_file = pathlib.Path("tests/data/releven_assertions_20240821.xml")
+prefixes = {"crm": "http://www.cidoc-crm.org/cidoc-crm/"}
+
+
+def test_build_query():
+    _root_types, paths = parse_paths(test_data_file)
+    root = endpoint_exclude_fields(paths["external_authority"], [], "Ea")
+    query = build_query(root, prefixes)
+    assert query.where.triples == [
+        Triple(
+            Variable("Ea"),
+            IRI(RDF_TYPE),
+            IRI("http://iflastandards.info/ns/lrm/lrmoo/F11_Corporate_Body"),
+        )
+    ]
+    assert [variable.name for variable in query.where.variables()] == [
+        "Ea",
+        "Ea_external_authority_display_name",
+        "Ea_external_authority_url",
+    ]
+    serializer = Serializer(query)
+    assert serializer.iri(IRI("^http://www.cidoc-crm.org/cidoc-crm/P1")) == "^crm:P1"
+    assert serializer.iri(IRI("http://example.org/a(b)")) == "<http://example.org/a(b)>"
+
+
+def test_serialize_query():
+    _root_types, paths = parse_paths(test_data_file)
+    root = endpoint_exclude_fields(paths["person"], [], "Person", max_depth=1)
+    prepareQuery(serialize_query(root, prefixes))
+    prepareQuery(serialize_query(root, prefixes, optimize=False))
+
+
+def test_optimize():
+    def var(name):
+        return Variable(name)
+
+    def typed(name, cls):
+        return Triple(var(name), IRI(RDF_TYPE), IRI(cls))
+
+    p, q, r = IRI("urn:p"), IRI("urn:q"), IRI("urn:r")
+    where = GroupPattern(
+        "root",
+        var("x"),
+        [typed("x", "urn:X")],
+        [
+            GroupPattern(
+                "note",
+                var("n"),
+                [typed("x", "urn:X"), Triple(var("x"), r, var("n"))],
+                optional=True,
+            ),
+            GroupPattern(
+                "a",
+                var("a"),
+                [
+                    Triple(var("x"), p, var("a0")),
+                    typed("a0", "urn:A"),
+                    Triple(var("a0"), q, var("a")),
+                ],
+            ),
+            GroupPattern(
+                "b",
+                var("b"),
+                [
+                    Triple(var("x"), p, var("b0")),
+                    typed("b0", "urn:A"),
+                    Triple(var("b0"), r, var("b")),
+                ],
+            ),
+        ],
+    )
+    query = SelectQuery(where, list(where.variables()))
+    optimized = optimize(query)
+    assert optimized.projection == query.projection
+    # a0 and b0 are independent, even though they are reached in the same way
+    assert optimized.where.triples == [
+        typed("x", "urn:X"),
+        Triple(var("x"), p, var("a0")),
+        typed("a0", "urn:A"),
+        Triple(var("a0"), q, var("a")),
+        Triple(var("x"), p, var("b0")),
+        typed("b0", "urn:A"),
+        Triple(var("b0"), r, var("b")),
+    ]
+    # the type pattern is already required outside of the OPTIONAL block
+    assert [child.triples for child in optimized.where.children] == [
+        [Triple(var("x"), r, var("n"))]
+    ]
+    # the input query is left untouched
+    assert len(query.where.children) == 3
+
+    # both queries have the same solutions, also if the fields are reached via different nodes
+    graph = Graph().parse(
+        data="""
+        <urn:x> a <urn:X> ; <urn:p> <urn:a0>, <urn:b0> .
+        <urn:a0> a <urn:A> ; <urn:q> "a" .
+        <urn:b0> a <urn:A> ; <urn:r> "b" .
+        """,
+        format="turtle",
+    )
+    solutions = set(graph.query(Serializer(query).serialize()))
+    assert len(solutions) == 1
+    assert set(graph.query(Serializer(optimized).serialize())) == solutions